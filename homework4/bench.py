@@ -0,0 +1,237 @@
+"""
+Замеры производительности homework4 с выводом в JSON.
+
+    python bench.py --json bench.json                 # полный прогон
+    python bench.py --quick --filter generate         # быстро и выборочно
+    python bench.py --compare baseline.json           # сравнить с прошлым прогоном
+
+Каждый замер: setup готовит данные (не замеряется), дальше функция
+вызывается number раз подряд, и так repeat раз. В отчёт идёт время
+одной операции: минимум, медиана и среднее по повторам. С --compare
+замеры, ставшие медленнее базовых больше чем на --tolerance (по
+медиане), печатаются, и процесс выходит с кодом 1.
+"""
+from __future__ import annotations
+import argparse
+import json
+import platform
+import random
+import statistics
+import sys
+import time
+from typing import Callable, Dict, List, Optional, Tuple
+
+from bettercode import Dungeon, FieldOfView, Game, GameConfig, MapRenderer
+from headless import BotPolicy, null_sink, play_game
+
+FORMAT_VERSION = 1
+
+# (имя, параметры, setup -> функция без аргументов, number)
+Case = Tuple[str, Dict, Callable[[], Callable[[], object]], int]
+
+# -----------------------------
+# Замеры
+# -----------------------------
+def generate_cases(quick: bool) -> List[Case]:
+    # плотность содержимого в этом дереве фиксирована (n*m/6), поэтому
+    # меняются размер, вид сетки и сложность (она влияет на лут и врагов)
+    sizes = (8, 64, 256) if quick else (8, 64, 256, 512)
+    cases = []
+    for size in sizes:
+        for compact in (False, True):
+            for difficulty in (1, 10):
+                number = max(1, 20000 // (size * size))
+                params = {'size': size, 'compact': compact, 'difficulty': difficulty}
+
+                def setup(size=size, compact=compact, difficulty=difficulty):
+                    rng = random.Random(0)
+                    return lambda: Dungeon(n=size, m=size, difficulty=difficulty, rng=rng, compact=compact)
+                cases.append(('dungeon.generate', params, setup, number))
+    return cases
+
+def random_cell_cases(quick: bool) -> List[Case]:
+    cases = []
+    for size in (64, 256):
+        for share in (0.1, 0.5, 0.9):
+            params = {'size': size, 'exclude_share': share}
+
+            def setup(size=size, share=share):
+                d = Dungeon(n=size, m=size, rng=random.Random(0), compact=True)
+                cells = [divmod(c, d.m) for c in d.free.cells]
+                random.Random(1).shuffle(cells)
+                exclude = set(cells[:int(len(cells) * share)])
+                return lambda: d.random_cell(exclude=exclude, exclude_center=True)
+            cases.append(('dungeon.random_cell', params, setup, 20 if size > 64 else 200))
+    return cases
+
+def _game(size: int, compact: bool = True, radius: Optional[int] = None, seed: int = 0) -> Game:
+    cfg = GameConfig(size_min=size, size_max=size, compact=compact, view_radius=radius)
+    return Game(policy=BotPolicy(seed), out=null_sink, config=cfg, rng=random.Random(seed))
+
+def render_cases(quick: bool) -> List[Case]:
+    cases = []
+    for size in (16, 128) if quick else (16, 128, 512):
+        for radius in (None, 10):
+            params = {'size': size, 'radius': radius}
+
+            def cold(size=size, radius=radius):
+                g = _game(size, radius=radius)
+                def run():
+                    g.renderer = MapRenderer(g, radius=radius)
+                    g.render_map()
+                return run
+
+            def warm(size=size, radius=radius):
+                # ход туда-обратно между отрисовками: пара грязных клеток, сдвиг игрока
+                g = _game(size, radius=radius)
+                g.render_map()
+                state = {'k': 0}
+                def run():
+                    g.player.y = g.dungeon.m // 2 + (state['k'] & 1)
+                    g.dungeon.mark_dirty(g.player.x, g.player.y, kind_changed=False)
+                    state['k'] += 1
+                    g.render_map()
+                return run
+            number = 1 if size >= 512 and radius is None else 20
+            cases.append(('render_map.cold', params, cold, number))
+            cases.append(('render_map.warm', params, warm, number * 5))
+    return cases
+
+def fov_cases(quick: bool) -> List[Case]:
+    # ход туда-обратно: пересчёт поля зрения не зависит от размера карты
+    cases = []
+    for size in (64, 1024) if quick else (64, 1024, 4096):
+        for radius in (4, 12):
+            params = {'size': size, 'radius': radius}
+
+            def setup(size=size, radius=radius):
+                d = Dungeon(n=size, m=size, rng=random.Random(0), compact=True)
+                fov = FieldOfView(radius, blocking=('chest',))
+                state = {'k': 0}
+                def run():
+                    state['k'] += 1
+                    fov.update(d, size // 2, size // 2 + (state['k'] & 1))
+                return run
+            cases.append(('fov.update', params, setup, 200))
+    return cases
+
+def step_cases(quick: bool) -> List[Case]:
+    cases = []
+    for size, compact in ((8, False), (64, True), (256, True)):
+        params = {'size': size, 'compact': compact, 'commands': 'bot'}
+
+        def setup(size=size, compact=compact):
+            g = _game(size, compact=compact)
+            pol = g.policy
+            def run():
+                nonlocal g, pol
+                if not g.step(pol.command(g)):
+                    g = _game(size, compact=compact, seed=g.turns)
+                    pol = g.policy
+            return run
+        cases.append(('game.step', params, setup, 500))
+
+    params = {'size': 8, 'commands': 'inv/map/unknown'}
+
+    def setup_cheap():
+        g = _game(8, compact=False)
+        cmds = ['inv', 'map', 'look', 'use 99', 'equip x']
+        state = {'k': 0}
+        def run():
+            state['k'] += 1
+            g.step(cmds[state['k'] % len(cmds)])
+        return run
+    cases.append(('game.step', params, setup_cheap, 1000))
+    return cases
+
+def headless_cases(quick: bool) -> List[Case]:
+    games = 20 if quick else 100
+    params = {'games': games, 'bot': 'simple', 'max_turns': 2000}
+
+    def setup():
+        return lambda: [play_game(s, max_turns=2000) for s in range(games)]
+    return [('headless.games', params, setup, 1)]
+
+SUITES = [generate_cases, random_cell_cases, render_cases, fov_cases, step_cases, headless_cases]
+
+# -----------------------------
+# Прогон
+# -----------------------------
+def measure(setup: Callable, number: int, repeat: int) -> List[float]:
+    """Время одной операции в каждом из repeat повторов, с."""
+    fn = setup()
+    fn()  # прогрев (ленивые кэши, lru_cache каталога)
+    times = []
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        for _ in range(number):
+            fn()
+        times.append((time.perf_counter() - t0) / number)
+    return times
+
+def run(quick: bool = False, repeat: int = 5, name_filter: str = '') -> Dict:
+    results = []
+    for suite in SUITES:
+        for name, params, setup, number in suite(quick):
+            if name_filter and name_filter not in name:
+                continue
+            times = measure(setup, number, repeat)
+            med = statistics.median(times)
+            results.append({
+                'name': name,
+                'params': params,
+                'number': number,
+                'repeat': repeat,
+                'min_s': min(times),
+                'median_s': med,
+                'mean_s': statistics.fmean(times),
+                'ops_per_s': 1 / med if med else None,
+            })
+            print(f"{case_id(results[-1]):60s} {med * 1e6:12.1f} мкс", file=sys.stderr)
+    return {
+        'version': FORMAT_VERSION,
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'quick': quick,
+        'results': results,
+    }
+
+def case_id(r: Dict) -> str:
+    params = ','.join(f'{k}={v}' for k, v in sorted(r['params'].items()))
+    return f"{r['name']}[{params}]"
+
+def compare(report: Dict, baseline: Dict, tolerance: float) -> List[str]:
+    base = {case_id(r): r for r in baseline['results']}
+    slower = []
+    for r in report['results']:
+        b = base.get(case_id(r))
+        if b is None:
+            continue
+        ratio = r['median_s'] / b['median_s']
+        if ratio > 1 + tolerance:
+            slower.append(f"{case_id(r)}: {b['median_s'] * 1e6:.1f} -> {r['median_s'] * 1e6:.1f} мкс (x{ratio:.2f})")
+    return slower
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser(description="Замеры производительности homework4")
+    ap.add_argument('--quick', action='store_true', help='меньше размеров и партий')
+    ap.add_argument('--repeat', type=int, default=5)
+    ap.add_argument('--filter', default='', help='только замеры, в имени которых есть подстрока')
+    ap.add_argument('--json', help='куда сохранить отчёт (по умолчанию stdout)')
+    ap.add_argument('--compare', help='отчёт-база для поиска регрессий')
+    ap.add_argument('--tolerance', type=float, default=0.2, help='допустимое замедление, доля')
+    args = ap.parse_args()
+
+    report = run(quick=args.quick, repeat=args.repeat, name_filter=args.filter)
+    text = json.dumps(report, indent=2, sort_keys=True)
+    if args.json:
+        with open(args.json, 'w') as f:
+            f.write(text + '\n')
+    else:
+        print(text)
+    if args.compare:
+        with open(args.compare) as f:
+            slower = compare(report, json.load(f), args.tolerance)
+        for line in slower:
+            print("Медленнее базы: " + line, file=sys.stderr)
+        sys.exit(1 if slower else 0)
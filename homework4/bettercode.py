@@ -4,9 +4,14 @@
 from __future__ import annotations
 import random
 import sys
-from dataclasses import dataclass, field
+from array import array
+from dataclasses import InitVar, dataclass, field
+from functools import lru_cache
+from time import perf_counter
 from typing import List, Optional, Tuple, Dict
 
+from combat import predict
+
 # -----------------------------
 # Константы и утилиты
 # -----------------------------
@@ -31,34 +36,64 @@ SYMBOLS = {
 def clamp(v, a, b):
     return max(a, min(b, v))
 
-def roll(minv, maxv):
-    return random.randint(minv, maxv)
+def roll(minv, maxv, rng=random):
+    # rng — свой генератор (random.Random); по умолчанию глобальный модуль random
+    return rng.randint(minv, maxv)
 
 # -----------------------------
 # Items / Equipment / Consumables
 # -----------------------------
-@dataclass
+# предметы неизменяемы, поэтому одинаковые можно делить (см. каталог ниже)
+@dataclass(frozen=True, slots=True)
 class Item:
     name: str
     desc: str
 
-@dataclass
+@dataclass(frozen=True, slots=True)
 class Weapon(Item):
     atk: int = 0
 
-@dataclass
+@dataclass(frozen=True, slots=True)
 class Armor(Item):
     defense: int = 0
 
-@dataclass
+@dataclass(frozen=True, slots=True)
 class Consumable(Item):
     heal: int = 0
     # можно расширить (бонусы и т.д.)
 
+# -----------------------------
+# Каталог предметов: одинаковый предмет — один общий объект,
+# имя и описание строятся при первой встрече такого предмета
+# -----------------------------
+@lru_cache(maxsize=None)
+def catalog_item(cls: type, name: str, desc: str, stat: int = 0) -> Item:
+    return cls(name, desc) if cls is Item else cls(name, desc, stat)
+
+@lru_cache(maxsize=None)
+def potion(heal: int) -> Consumable:
+    return catalog_item(Consumable, 'Зелье', f'Восстанавливает {heal} HP', heal)
+
+@lru_cache(maxsize=None)
+def small_potion(heal: int) -> Consumable:
+    return catalog_item(Consumable, 'Малое зелье', 'Малое восстановление', heal)
+
+@lru_cache(maxsize=None)
+def weapon(atk: int) -> Weapon:
+    return catalog_item(Weapon, f'Оружие +{atk}', f'+{atk} к атаке', atk)
+
+@lru_cache(maxsize=None)
+def armor(defense: int) -> Armor:
+    return catalog_item(Armor, f'Доспех +{defense}', f'+{defense} к броне', defense)
+
+@lru_cache(maxsize=None)
+def enemy_name(difficulty: int) -> str:
+    return f'Гоблин L{difficulty}'
+
 # -----------------------------
 # Enemy
 # -----------------------------
-@dataclass
+@dataclass(slots=True)
 class Enemy:
     name: str
     hp: int
@@ -74,10 +109,13 @@ class Enemy:
     def is_alive(self) -> bool:
         return self.hp > 0
 
+def _copy_enemy(e: Optional[Enemy]) -> Optional[Enemy]:
+    return None if e is None else Enemy(e.name, e.hp, e.atk, e.defense, e.exp)
+
 # -----------------------------
 # Room and Dungeon
 # -----------------------------
-@dataclass
+@dataclass(slots=True)
 class Room:
     kind: str  # 'empty', 'chest', 'monster', 'trap', 'portal', 'key'
     seen: bool = False
@@ -103,6 +141,241 @@ class Room:
             return SYMBOLS['key']
         return SYMBOLS['unknown']
 
+# -----------------------------
+# Компактная сетка для больших карт
+# -----------------------------
+KINDS = ('empty', 'chest', 'monster', 'trap', 'portal', 'key')
+
+# что и с каким весом раскидывается по уровню
+FEATURES = ('chest', 'monster', 'trap', 'empty')
+FEATURE_WEIGHTS = (30, 40, 20, 10)
+KIND_CODE = {k: i for i, k in enumerate(KINDS)}
+
+# битовые флаги клетки
+F_SEEN = 1
+F_EXPLORED = 2
+F_CHEST_LOCKED = 4
+F_PORTAL_ENABLED = 8
+
+def _flag_property(bit):
+    def get(self):
+        return bool(self._g.flags[self._i] & bit)
+    def set(self, value):
+        if value:
+            self._g.flags[self._i] |= bit
+        else:
+            self._g.flags[self._i] &= ~bit & 0xFF
+    return property(get, set)
+
+class CompactRoom:
+    """Клетка CompactGrid с тем же интерфейсом, что у Room.
+
+    Сама ничего не хранит — читает и пишет массивы сетки по индексу.
+    chest_contents меняется только присваиванием (как и делает Game).
+    """
+    __slots__ = ('_g', '_i')
+
+    def __init__(self, grid: 'CompactGrid', idx: int):
+        self._g = grid
+        self._i = idx
+
+    @property
+    def kind(self) -> str:
+        return KINDS[self._g.kinds[self._i]]
+
+    @kind.setter
+    def kind(self, value: str):
+        self._g.kinds[self._i] = KIND_CODE[value]
+
+    seen = _flag_property(F_SEEN)
+    explored = _flag_property(F_EXPLORED)
+    chest_locked = _flag_property(F_CHEST_LOCKED)
+    portal_enabled = _flag_property(F_PORTAL_ENABLED)
+
+    @property
+    def trap_damage(self) -> int:
+        return self._g.trap[self._i]
+
+    @trap_damage.setter
+    def trap_damage(self, value: int):
+        self._g.trap[self._i] = value
+
+    @property
+    def enemy(self) -> Optional[Enemy]:
+        return self._g.enemies.get(self._i)
+
+    @enemy.setter
+    def enemy(self, value: Optional[Enemy]):
+        if value is None:
+            self._g.enemies.pop(self._i, None)
+        else:
+            self._g.enemies[self._i] = value
+
+    @property
+    def chest_contents(self) -> List[Item]:
+        return self._g.loot.get(self._i, [])
+
+    @chest_contents.setter
+    def chest_contents(self, value: List[Item]):
+        if value:
+            self._g.loot[self._i] = value
+        else:
+            self._g.loot.pop(self._i, None)
+
+    symbol_for_map = Room.symbol_for_map
+
+class _CompactRow:
+    __slots__ = ('_g', '_base')
+
+    def __init__(self, grid: 'CompactGrid', i: int):
+        self._g = grid
+        self._base = i * grid.m
+
+    def __len__(self):
+        return self._g.m
+
+    def __getitem__(self, j: int) -> CompactRoom:
+        if not 0 <= j < self._g.m:
+            raise IndexError(j)
+        return CompactRoom(self._g, self._base + j)
+
+    def __setitem__(self, j: int, room):
+        if not 0 <= j < self._g.m:
+            raise IndexError(j)
+        self._g.store(self._base + j, room)
+
+    def __iter__(self):
+        for j in range(self._g.m):
+            yield CompactRoom(self._g, self._base + j)
+
+class CompactGrid:
+    """Сетка на типизированных массивах: grid[i][j] работает как у списка списков.
+
+    kinds — код вида клетки (uint8), flags — битовые флаги (uint8),
+    trap — урон ловушки (uint16). Враги и содержимое сундуков лежат
+    в разреженных словарях по индексу клетки i*m + j.
+    """
+
+    def __init__(self, n: int, m: int):
+        self.n = n
+        self.m = m
+        self.kinds = bytearray(n * m)
+        self.flags = bytearray(n * m)
+        self.trap = array('H', bytes(2 * n * m))
+        self.enemies: Dict[int, Enemy] = {}
+        self.loot: Dict[int, List[Item]] = {}
+
+    def __len__(self):
+        return self.n
+
+    def __getitem__(self, i: int) -> _CompactRow:
+        if not 0 <= i < self.n:
+            raise IndexError(i)
+        return _CompactRow(self, i)
+
+    def __iter__(self):
+        for i in range(self.n):
+            yield _CompactRow(self, i)
+
+    def clear(self):
+        size = self.n * self.m
+        self.kinds = bytearray(size)
+        self.flags = bytearray(size)
+        self.trap = array('H', bytes(2 * size))
+        self.enemies.clear()
+        self.loot.clear()
+
+    def place_bulk(self, chests, locked, loot, monsters, enemies, traps, damage):
+        """Расставляет сгенерированные пачкой сундуки, монстров и ловушки."""
+        kinds, flags, trap = self.kinds, self.flags, self.trap
+        code = KIND_CODE['chest']
+        for c, lk in zip(chests, locked):
+            kinds[c] = code
+            if lk:
+                flags[c] |= F_CHEST_LOCKED
+        self.loot.update(zip(chests, loot))
+        code = KIND_CODE['monster']
+        for c in monsters:
+            kinds[c] = code
+        self.enemies.update(zip(monsters, enemies))
+        code = KIND_CODE['trap']
+        for c, dmg in zip(traps, damage):
+            kinds[c] = code
+            trap[c] = dmg
+
+    def copy(self) -> 'CompactGrid':
+        g = CompactGrid.__new__(CompactGrid)
+        g.n, g.m = self.n, self.m
+        g.kinds, g.flags, g.trap = bytearray(self.kinds), bytearray(self.flags), array('H', self.trap)
+        g.enemies = {i: _copy_enemy(e) for i, e in self.enemies.items()}
+        g.loot = {i: list(items) for i, items in self.loot.items()}
+        return g
+
+    def store(self, idx: int, room):
+        """Записывает Room (или CompactRoom) в клетку idx."""
+        self.kinds[idx] = KIND_CODE[room.kind]
+        self.flags[idx] = ((F_SEEN if room.seen else 0)
+                           | (F_EXPLORED if room.explored else 0)
+                           | (F_CHEST_LOCKED if room.chest_locked else 0)
+                           | (F_PORTAL_ENABLED if room.portal_enabled else 0))
+        self.trap[idx] = room.trap_damage
+        if room.enemy is not None:
+            self.enemies[idx] = room.enemy
+        else:
+            self.enemies.pop(idx, None)
+        if room.chest_contents:
+            self.loot[idx] = room.chest_contents
+        else:
+            self.loot.pop(idx, None)
+
+class CellPool:
+    """Множество индексов клеток: добавление, удаление и случайный выбор за O(1).
+
+    cells — сами клетки (порядок произвольный), pos[c] — место клетки c
+    в cells или -1. Удаление переставляет на место удалённой последнюю.
+    """
+
+    def __init__(self, size: int):
+        self.cells = array('i', range(size))
+        self.pos = array('i', range(size))
+
+    def __len__(self):
+        return len(self.cells)
+
+    def __contains__(self, c: int) -> bool:
+        return self.pos[c] >= 0
+
+    def add(self, c: int):
+        if self.pos[c] < 0:
+            self.pos[c] = len(self.cells)
+            self.cells.append(c)
+
+    def discard(self, c: int) -> bool:
+        i = self.pos[c]
+        if i < 0:
+            return False
+        last = self.cells.pop()
+        if last != c:
+            self.cells[i] = last
+            self.pos[last] = i
+        self.pos[c] = -1
+        return True
+
+    def choice(self, rng: random.Random) -> int:
+        return self.cells[rng.randrange(len(self.cells))]
+
+    def sample(self, rng: random.Random, k: int) -> List[int]:
+        return rng.sample(self.cells, k)
+
+    def copy(self) -> 'CellPool':
+        pool = CellPool.__new__(CellPool)
+        pool.cells = array('i', self.cells)
+        pool.pos = array('i', self.pos)
+        return pool
+
+# сколько промахов в исключённые клетки random_cell терпит, прежде чем вынуть их из пула
+RANDOM_CELL_TRIES = 64
+
 @dataclass
 class Dungeon:
     n: int
@@ -110,113 +383,253 @@ class Dungeon:
     grid: List[List[Room]] = field(init=False)
     portal_pos: Tuple[int, int] = field(init=False)
     key_pos: Tuple[int, int] = field(init=False)
+    free: CellPool = field(init=False, repr=False)  # клетки без содержимого
+    # клетки, изменившиеся с последней отрисовки (индексы x*m + y), и счётчик изменений
+    dirty: set = field(init=False, repr=False, default_factory=set)
+    revision: int = field(init=False, repr=False, default=0)
     seed: Optional[int] = None
     difficulty: int = 1
+    # собственный генератор подземелья; глобальный random не трогаем,
+    # чтобы подземелья можно было генерировать параллельно в потоках
+    rng: Optional[random.Random] = field(default=None, repr=False, compare=False)
+    # compact=True — сетка на массивах (CompactGrid) для огромных карт
+    compact: bool = False
+    # generate=False — пустая сетка без содержимого (например, для загрузки сохранения)
+    generate: InitVar[bool] = True
 
-    def __post_init__(self):
-        if self.seed is not None:
-            random.seed(self.seed)
-        self.grid = [[Room(kind='empty') for _ in range(self.m)] for __ in range(self.n)]
+    def __post_init__(self, generate=True):
+        if self.rng is None:
+            self.rng = random.Random(self.seed)
+        if self.compact:
+            self.grid = CompactGrid(self.n, self.m)
+        else:
+            self.grid = [[Room(kind='empty') for _ in range(self.m)] for __ in range(self.n)]
         self.portal_pos = (0, 0)
         self.key_pos = (0, 0)
-        self.generate_contents()
+        if generate:
+            self.generate_contents()
+        else:
+            self.free = CellPool(self.n * self.m)
 
     def generate_contents(self):
         # probabilities варьируются с уровнем difficulty
-        for i in range(self.n):
-            for j in range(self.m):
-                self.grid[i][j] = Room(kind='empty')
+        if self.compact:
+            self.grid.clear()
+        else:
+            for i in range(self.n):
+                for j in range(self.m):
+                    self.grid[i][j] = Room(kind='empty')
+
+        self.free = CellPool(self.n * self.m)
 
         # Place portal (disabled until key found)
         px, py = self.random_cell(exclude_center=True)
+        self.occupy(px, py)
         self.portal_pos = (px, py)
         self.grid[px][py].kind = 'portal'
         self.grid[px][py].portal_enabled = False
 
         # Place key somewhere else (maybe chest or key-room)
-        kx, ky = self.random_cell(exclude={(px,py)}, exclude_center=True)
+        kx, ky = self.random_cell(exclude_center=True)
+        self.occupy(kx, ky)
         self.key_pos = (kx, ky)
         self.grid[kx][ky].kind = 'key'
 
-        # Place some chests, enemies, traps
-        count = max( (self.n*self.m)//6, 4 )
-        for _ in range(count):
-            x,y = self.random_cell(exclude={(px,py),(kx,ky)})
-            choice = random.choices(['chest','monster','trap','empty'], weights=[30,40,20,10])[0]
-            if choice == 'chest':
-                room = Room(kind='chest', chest_locked=random.random() < 0.5)
-                room.chest_contents = self.generate_loot()
-                self.grid[x][y] = room
-            elif choice == 'monster':
-                enemy = self.generate_enemy()
-                room = Room(kind='monster', enemy=enemy)
-                self.grid[x][y] = room
-            elif choice == 'trap':
-                dmg = roll(2 + self.difficulty, 5 + self.difficulty*3)
-                room = Room(kind='trap', trap_damage=dmg)
-                self.grid[x][y] = room
-            # empty ignored
+        # Place some chests, enemies, traps — пачкой: клетки без повторов
+        # одним sample из свободных, виды одним choices, дальше статы по каждому виду
+        n, m, rng = self.n, self.m, self.rng
+        count = max( (n*m)//6, 4 )
+        cells = self.free.sample(rng, min(count, len(self.free)))
+        kinds = rng.choices(FEATURES, weights=FEATURE_WEIGHTS, k=len(cells))
+        chests = [c for c, k in zip(cells, kinds) if k == 'chest']
+        monsters = [c for c, k in zip(cells, kinds) if k == 'monster']
+        traps = [c for c, k in zip(cells, kinds) if k == 'trap']
+        # empty ignored
+        for c in chests + monsters + traps:
+            self.free.discard(c)
+
+        d = self.difficulty
+        locked = [rng.random() < 0.5 for _ in chests]
+        loot = [self.generate_loot() for _ in chests]
+        enemies = [self.generate_enemy() for _ in monsters]
+        damage = [rng.randint(2 + d, 5 + d*3) for _ in traps]
+
+        if self.compact:
+            self.grid.place_bulk(chests, locked, loot, monsters, enemies, traps, damage)
+            return
+        grid = self.grid
+        for c, lk, items in zip(chests, locked, loot):
+            grid[c // m][c % m] = Room(kind='chest', chest_locked=lk, chest_contents=items)
+        for c, e in zip(monsters, enemies):
+            grid[c // m][c % m] = Room(kind='monster', enemy=e)
+        for c, dmg in zip(traps, damage):
+            grid[c // m][c % m] = Room(kind='trap', trap_damage=dmg)
 
     def random_cell(self, exclude: set = None, exclude_center=False):
-        if exclude is None:
-            exclude = set()
-        attempts = 0
-        while True:
-            x = random.randint(0, self.n-1)
-            y = random.randint(0, self.m-1)
-            if exclude_center:
-                cx, cy = self.n//2, self.m//2
-                if (x,y) == (cx,cy):
-                    attempts += 1
-                    if attempts > 200:
-                        break
-                    continue
-            if (x,y) in exclude:
-                attempts += 1
-                if attempts > 200:
-                    break
-                continue
-            return (x,y)
-        # fallback
-        for i in range(self.n):
-            for j in range(self.m):
-                if (i,j) not in exclude:
-                    return (i,j)
-        return (0,0)
+        """Случайная свободная клетка за O(1). Сама клетку не занимает — см. occupy."""
+        if not self.free:
+            return (0,0)
+        center = (self.n//2)*self.m + self.m//2 if exclude_center else -1
+        n_excluded = (len(exclude) if exclude else 0) + exclude_center
+        # пока исключённых заметно меньше пула — тянем заново при попадании в них
+        if n_excluded * 16 < len(self.free) * 15:
+            for _ in range(RANDOM_CELL_TRIES):
+                c = self.free.choice(self.rng)
+                if c != center and not (exclude and divmod(c, self.m) in exclude):
+                    return divmod(c, self.m)
+        held = []
+        if exclude_center:
+            held.append(center)
+        if exclude:
+            held.extend(x*self.m + y for x, y in exclude)
+        # исключены почти все или не повезло: вынимаем исключённые из пула, потом возвращаем
+        held = [c for c in held if self.free.discard(c)]
+        c = self.free.choice(self.rng) if self.free else None
+        for h in held:
+            self.free.add(h)
+        if c is None:
+            return (0,0)
+        return divmod(c, self.m)
+
+    def occupy(self, x: int, y: int):
+        self.free.discard(x*self.m + y)
+
+    def release(self, x: int, y: int):
+        self.free.add(x*self.m + y)
 
     def generate_loot(self) -> List[Item]:
         loot = []
         # higher difficulty → better loot chances
-        r = random.randint(0, 100)
+        r = self.rng.randint(0, 100)
         if r < 40:
             # consumable
-            heal = roll(5 + self.difficulty*2, 20 + self.difficulty*3)
-            loot.append(Consumable(name='Зелье', desc=f'Восстанавливает {heal} HP', heal=heal))
+            heal = roll(5 + self.difficulty*2, 20 + self.difficulty*3, self.rng)
+            loot.append(potion(heal))
         elif r < 70:
             # weapon
-            atk = roll(1 + self.difficulty, 3 + self.difficulty*2)
-            loot.append(Weapon(name=f'Оружие +{atk}', desc=f'+{atk} к атаке', atk=atk))
+            atk = roll(1 + self.difficulty, 3 + self.difficulty*2, self.rng)
+            loot.append(weapon(atk))
         else:
             # armor
-            df = roll(1 + self.difficulty, 3 + self.difficulty*2)
-            loot.append(Armor(name=f'Доспех +{df}', desc=f'+{df} к броне', defense=df))
+            df = roll(1 + self.difficulty, 3 + self.difficulty*2, self.rng)
+            loot.append(armor(df))
         # sometimes add coins or another item
-        if random.random() < 0.2:
-            loot.append(Consumable(name='Малое зелье', desc='Малое восстановление', heal=roll(3,8)))
+        if self.rng.random() < 0.2:
+            loot.append(small_potion(roll(3, 8, self.rng)))
         return loot
 
     def generate_enemy(self) -> Enemy:
         # enemy scales with difficulty
-        base_hp = roll(5 + self.difficulty*2, 8 + self.difficulty*4)
-        atk = roll(1 + self.difficulty, 2 + self.difficulty*2)
-        df = roll(0, self.difficulty)
-        return Enemy(name=f'Гоблин L{self.difficulty}', hp=base_hp, atk=atk, defense=df, exp=5 + self.difficulty*2)
+        base_hp = roll(5 + self.difficulty*2, 8 + self.difficulty*4, self.rng)
+        atk = roll(1 + self.difficulty, 2 + self.difficulty*2, self.rng)
+        df = roll(0, self.difficulty, self.rng)
+        return Enemy(name=enemy_name(self.difficulty), hp=base_hp, atk=atk, defense=df, exp=5 + self.difficulty*2)
 
     def reveal_portal_if_key(self):
         px, py = self.portal_pos
         self.grid[px][py].portal_enabled = True
+        self.mark_dirty(px, py, kind_changed=False)
         # change description (visual handled in map)
 
+    def copy(self, rng: Optional[random.Random] = None) -> 'Dungeon':
+        """Независимая копия (враги и сундуки свои, предметы общие — они неизменяемы)."""
+        d = Dungeon.__new__(Dungeon)
+        d.n, d.m, d.seed, d.difficulty, d.compact = self.n, self.m, self.seed, self.difficulty, self.compact
+        d.rng = rng if rng is not None else random.Random(self.seed)
+        if self.compact:
+            d.grid = self.grid.copy()
+        else:
+            d.grid = [[Room(r.kind, r.seen, r.explored, r.chest_locked, list(r.chest_contents),
+                            _copy_enemy(r.enemy), r.trap_damage, r.portal_enabled) for r in row]
+                      for row in self.grid]
+        d.portal_pos, d.key_pos = self.portal_pos, self.key_pos
+        d.free = self.free.copy()
+        d.dirty = set(self.dirty)
+        d.revision = self.revision
+        return d
+
+    def mark_dirty(self, x: int, y: int, kind_changed: bool = True):
+        """Сообщает, что комната (x, y) изменилась (вид, explored и т.п.).
+
+        revision растёт только при смене вида — по нему сбрасываются кэши путей.
+        """
+        self.dirty.add(x*self.m + y)
+        if kind_changed:
+            self.revision += 1
+
+# -----------------------------
+# Inventory
+# -----------------------------
+# метка и поле стата для списка инвентаря
+ITEM_STATS = {Weapon: ('ATK', 'atk'), Armor: ('DEF', 'defense'), Consumable: ('HEAL', 'heal')}
+
+class Inventory:
+    """Инвентарь из стопок: одинаковые предметы лежат в одной стопке.
+
+    У стопки стабильный номер — он не сдвигается, когда другие предметы
+    забирают, по нему работают use N / equip N. Номера стопок каждого
+    типа хранятся отдельно, так что поиск зелья или оружия не перебирает
+    весь инвентарь. Добавление, взятие и поиск по номеру — O(1).
+    """
+    __slots__ = ('_slots', '_ids', '_by_type', 'next_id')
+
+    def __init__(self):
+        self._slots: Dict[int, List] = {}      # номер -> [предмет, сколько]
+        self._ids: Dict[Item, int] = {}        # предмет -> номер его стопки
+        self._by_type: Dict[type, Dict[int, Item]] = {}
+        self.next_id = 0
+
+    def add(self, item: Item, count: int = 1) -> int:
+        sid = self._ids.get(item)
+        if sid is None:
+            sid = self.next_id
+            self.put(sid, item, count)
+        else:
+            self._slots[sid][1] += count
+        return sid
+
+    def put(self, sid: int, item: Item, count: int):
+        """Кладёт стопку под заданным номером (для загрузки сохранений)."""
+        self._slots[sid] = [item, count]
+        self._ids[item] = sid
+        self._by_type.setdefault(type(item), {})[sid] = item
+        self.next_id = max(self.next_id, sid + 1)
+
+    def get(self, sid: int) -> Optional[Item]:
+        slot = self._slots.get(sid)
+        return slot[0] if slot else None
+
+    def take(self, sid: int) -> Item:
+        """Забирает один предмет из стопки sid."""
+        slot = self._slots[sid]
+        item = slot[0]
+        slot[1] -= 1
+        if not slot[1]:
+            del self._slots[sid]
+            del self._ids[item]
+            del self._by_type[type(item)][sid]
+        return item
+
+    def of_type(self, cls: type) -> Dict[int, Item]:
+        """Стопки предметов типа cls: номер -> предмет (в порядке появления)."""
+        return self._by_type.get(cls, {})
+
+    def stacks(self):
+        """(номер, предмет, сколько) в порядке появления."""
+        for sid, (item, count) in self._slots.items():
+            yield sid, item, count
+
+    def __contains__(self, sid: int) -> bool:
+        return sid in self._slots
+
+    def __len__(self) -> int:
+        return len(self._slots)
+
+    def __iter__(self):
+        for item, count in self._slots.values():
+            for _ in range(count):
+                yield item
+
 # -----------------------------
 # Player
 # -----------------------------
@@ -230,7 +643,7 @@ class Player:
     def_base: int = 0
     weapon: Optional[Weapon] = None
     armor: Optional[Armor] = None
-    inventory: List[Item] = field(default_factory=list)
+    inventory: Inventory = field(default_factory=Inventory)
     keys: int = 0
     level: int = 1
     exp: int = 0
@@ -263,201 +676,639 @@ class Player:
             return f"Экипирована броня {item.name}. (Старая: {old})"
         return "Это нельзя экипировать."
 
-    def add_item(self, item: Item):
-        self.inventory.append(item)
+    def add_item(self, item: Item) -> int:
+        return self.inventory.add(item)
 
     def use_consumable(self, idx:int) -> str:
-        if idx < 0 or idx >= len(self.inventory):
+        item = self.inventory.get(idx)
+        if item is None:
             return "Неверный индекс."
-        item = self.inventory[idx]
         if not isinstance(item, Consumable):
             return "Это не расходник."
         self.heal(item.heal)
-        self.inventory.pop(idx)
+        self.inventory.take(idx)
         return f"Использовано {item.name}, +{item.heal} HP."
 
+# -----------------------------
+# Отрисовка карты
+# -----------------------------
+def cell_symbol(room, reveal_traps=False, fog=False) -> str:
+    # fog=True — клетки, которых игрок ещё не видел, скрыты
+    if fog and not room.seen:
+        return SYMBOLS['unknown']
+    # don't reveal monsters/traps unless explored (or reveal_traps True)
+    if room.kind == 'monster' and not room.explored:
+        return SYMBOLS['empty']
+    return room.symbol_for_map(reveal_traps=reveal_traps)
+
+CHUNK = 16  # сторона чанка кэша символов
+
+class MapRenderer:
+    """Кэширует символы карты и перерисовывает только изменившиеся клетки.
+
+    Символы хранятся чанками CHUNK x CHUNK, которые строятся лениво —
+    только когда попадают в окно вывода. radius=None — вся карта,
+    иначе окно (2*radius+1)^2 вокруг игрока, и стоимость хода зависит
+    от размера окна, а не подземелья. Изменившиеся клетки берутся из
+    Dungeon.dirty; игрок рисуется поверх кэша. fog=True — туман войны:
+    невиданные клетки рисуются как '?'.
+    """
+
+    def __init__(self, game: 'Game', radius: Optional[int] = None, fog: bool = False):
+        self.game = game
+        self.radius = radius
+        self.fog = fog
+        self.dungeon = None
+        self.reveal_traps = False
+        self.chunks: Dict[Tuple[int, int], List[List[str]]] = {}
+        self.window: Optional[Tuple[int, int, int, int]] = None  # x0, x1, y0, y1
+        self.player_pos: Optional[Tuple[int, int]] = None
+        self.lines: List[str] = []
+        self.text: Optional[str] = None
+        self.screen_height = 0
+
+    def _chunk(self, ci: int, cj: int) -> List[List[str]]:
+        ch = self.chunks.get((ci, cj))
+        if ch is None:
+            d, rt, fog = self.dungeon, self.reveal_traps, self.fog
+            ys = range(cj*CHUNK, min((cj+1)*CHUNK, d.m))
+            ch = [[cell_symbol(d.grid[i][j], rt, fog) for j in ys]
+                  for i in range(ci*CHUNK, min((ci+1)*CHUNK, d.n))]
+            self.chunks[(ci, cj)] = ch
+        return ch
+
+    def symbol(self, i: int, j: int) -> str:
+        if (i, j) == self.player_pos:
+            return SYMBOLS['player']
+        return self._chunk(i // CHUNK, j // CHUNK)[i % CHUNK][j % CHUNK]
+
+    def visible_window(self) -> Tuple[int, int, int, int]:
+        d = self.dungeon
+        if self.radius is None:
+            return (0, d.n, 0, d.m)
+        px, py = self.player_pos
+        h = min(2*self.radius + 1, d.n)
+        w = min(2*self.radius + 1, d.m)
+        x0 = clamp(px - self.radius, 0, d.n - h)
+        y0 = clamp(py - self.radius, 0, d.m - w)
+        return (x0, x0 + h, y0, y0 + w)
+
+    def _line(self, i: int) -> str:
+        _, _, y0, y1 = self.window
+        ci, ri = divmod(i, CHUNK)
+        row = []
+        for cj in range(y0 // CHUNK, (y1 - 1) // CHUNK + 1):
+            base = cj * CHUNK
+            row.extend(self._chunk(ci, cj)[ri][max(y0 - base, 0):y1 - base])
+        px, py = self.player_pos
+        if px == i:
+            row[py - y0] = SYMBOLS['player']
+        return ' '.join(row)
+
+    def update(self, reveal_traps=False) -> Optional[List[Tuple[int, int]]]:
+        """Обновляет кэш. Возвращает изменившиеся клетки окна или None, если окно перерисовано целиком."""
+        full = False
+        if self.game.dungeon is not self.dungeon or reveal_traps != self.reveal_traps:
+            self.dungeon = self.game.dungeon
+            self.reveal_traps = reveal_traps
+            self.chunks = {}
+            self.dungeon.dirty.clear()
+            full = True
+        d = self.dungeon
+        changed = []
+        for c in d.dirty:
+            i, j = divmod(c, d.m)
+            ch = self.chunks.get((i // CHUNK, j // CHUNK))
+            if ch is None:
+                continue  # чанк ещё не строился — построится сразу актуальным
+            sym = cell_symbol(d.grid[i][j], reveal_traps, self.fog)
+            if ch[i % CHUNK][j % CHUNK] != sym:
+                ch[i % CHUNK][j % CHUNK] = sym
+                changed.append((i, j))
+        d.dirty.clear()
+        pos = (self.game.player.x, self.game.player.y)
+        if pos != self.player_pos:
+            changed += [self.player_pos, pos]
+            self.player_pos = pos
+        window = self.visible_window()
+        if full or window != self.window:
+            self.window = window
+            x0, x1, _, _ = window
+            self.lines = [self._line(i) for i in range(x0, x1)]
+            self.text = None
+            return None
+        x0, x1, y0, y1 = window
+        changed = [(i, j) for i, j in changed if x0 <= i < x1 and y0 <= j < y1]
+        for i in {i for i, _ in changed}:
+            self.lines[i - x0] = self._line(i)
+        if changed:
+            self.text = None
+        return changed
+
+    def render(self, reveal_traps=False) -> str:
+        """Окно карты одной строкой; если ничего не менялось — та же строка из кэша."""
+        self.update(reveal_traps)
+        if self.text is None:
+            self.text = '\n'.join(self.lines)
+        return self.text
+
+    def render_ansi(self, reveal_traps=False) -> str:
+        """Escape-последовательности для терминала: карта закреплена сверху,
+        обновляются только изменившиеся клетки, остальной вывод прокручивается под ней."""
+        changed = self.update(reveal_traps)
+        if changed is None:
+            height = len(self.lines)
+            if height != self.screen_height:
+                # высота карты изменилась — чистим экран и заново задаём область прокрутки
+                self.screen_height = height
+                parts = ['\x1b[r\x1b[2J']
+                parts += [f'\x1b[{i+1};1H{line}' for i, line in enumerate(self.lines)]
+                parts.append(f'\x1b[{height+2}r\x1b[{height+2};1H')
+                return ''.join(parts)
+            parts = ['\x1b7']
+            parts += [f'\x1b[{i+1};1H\x1b[2K{line}' for i, line in enumerate(self.lines)]
+            parts.append('\x1b8')
+            return ''.join(parts)
+        if not changed:
+            return ''
+        x0, _, y0, _ = self.window
+        parts = ['\x1b7']
+        parts += [f'\x1b[{i-x0+1};{2*(j-y0)+1}H{self.symbol(i, j)}' for i, j in changed]
+        parts.append('\x1b8')
+        return ''.join(parts)
+
+# -----------------------------
+# Поле зрения
+# -----------------------------
+# (xx, xy, yx, yy): перевод координат октанта в смещение от игрока
+OCTANTS = ((1, 0, 0, 1), (0, 1, 1, 0), (0, -1, 1, 0), (-1, 0, 0, 1),
+           (-1, 0, 0, -1), (0, -1, -1, 0), (0, 1, -1, 0), (1, 0, 0, -1))
+
+class FieldOfView:
+    """Видимость вокруг игрока: рекурсивный shadowcasting в радиусе radius.
+
+    Видимые сейчас клетки — битсет visible (bytearray по индексу x*m + y),
+    так что is_visible — O(1). Клетки, виденные хоть раз, отмечаются
+    в Room.seen (в CompactGrid — флаг F_SEEN) и попадают в Dungeon.dirty,
+    чтобы карта перерисовала только их. Ход пересчитывает лишь круг
+    радиуса radius, размер подземелья на стоимость не влияет.
+
+    Стен в подземелье нет, поэтому что загораживает обзор, задаётся
+    видами клеток blocking (по умолчанию ничего); граница уровня
+    непрозрачна всегда.
+    """
+
+    def __init__(self, radius: int, blocking: Tuple[str, ...] = ()):
+        self.radius = radius
+        self.blocking = frozenset(blocking)
+        self.dungeon = None  # type: Optional[Dungeon]
+        self.pos = None      # type: Optional[Tuple[int, int]]
+        self.visible = bytearray()
+        self.cells: List[int] = []  # индексы, выставленные в visible
+
+    def is_visible(self, x: int, y: int) -> bool:
+        return self.dungeon is not None and bool(self.visible[x*self.dungeon.m + y])
+
+    def update(self, dungeon: 'Dungeon', x: int, y: int):
+        """Пересчитывает видимость для игрока в (x, y); повторный вызов с тем же местом бесплатен."""
+        if dungeon is self.dungeon and (x, y) == self.pos:
+            return
+        if dungeon is not self.dungeon:
+            self.dungeon = dungeon
+            self.visible = bytearray(dungeon.n * dungeon.m)
+            self.cells = []
+        visible = self.visible
+        for c in self.cells:
+            visible[c] = 0
+        self.pos = (x, y)
+        cells = {x*dungeon.m + y}
+        for octant in OCTANTS:
+            self._cast(x, y, 1, 1.0, 0.0, octant, cells)
+        self.cells = list(cells)
+        self._mark_seen(dungeon, self.cells)
+
+    def _mark_seen(self, d: 'Dungeon', cells: List[int]):
+        visible = self.visible
+        if d.compact:
+            flags = d.grid.flags
+            for c in cells:
+                visible[c] = 1
+                if not flags[c] & F_SEEN:
+                    flags[c] |= F_SEEN
+                    d.dirty.add(c)
+            return
+        grid, m = d.grid, d.m
+        for c in cells:
+            visible[c] = 1
+            room = grid[c // m][c % m]
+            if not room.seen:
+                room.seen = True
+                d.dirty.add(c)
+
+    def _cast(self, cx: int, cy: int, row: int, start: float, end: float,
+              octant: Tuple[int, int, int, int], out: set):
+        # один октант: строки от row до radius, видимый сектор наклонов [end, start]
+        if start < end:
+            return
+        xx, xy, yx, yy = octant
+        d, radius, blocking = self.dungeon, self.radius, self.blocking
+        # в CompactGrid вид читается из массива напрямую, без объекта клетки
+        kinds = d.grid.kinds if d.compact else None
+        codes = {KIND_CODE[k] for k in blocking}
+        r2 = radius * radius + radius  # чуть шире круга, чтобы край был ровнее
+        new_start = start
+        for j in range(row, radius + 1):
+            dx, dy = -j - 1, -j
+            blocked = False
+            while dx <= 0:
+                dx += 1
+                l_slope = (dx - 0.5) / (dy + 0.5)
+                r_slope = (dx + 0.5) / (dy - 0.5)
+                if start < r_slope:
+                    continue
+                if end > l_slope:
+                    break
+                x, y = cx + dx*xx + dy*xy, cy + dx*yx + dy*yy
+                if 0 <= x < d.n and 0 <= y < d.m:
+                    if dx*dx + dy*dy <= r2:
+                        out.add(x*d.m + y)
+                    if not blocking:
+                        opaque = False
+                    elif kinds is not None:
+                        opaque = kinds[x*d.m + y] in codes
+                    else:
+                        opaque = d.grid[x][y].kind in blocking
+                else:
+                    opaque = True  # граница уровня
+                if blocked:
+                    if opaque:
+                        new_start = r_slope
+                        continue
+                    blocked = False
+                    start = new_start
+                elif opaque and j < radius:
+                    blocked = True
+                    self._cast(cx, cy, j + 1, start, l_slope, octant, out)
+                    new_start = r_slope
+            if blocked:
+                break
+
+# -----------------------------
+# Настройки партии
+# -----------------------------
+@dataclass(frozen=True)
+class GameConfig:
+    # размер уровня выбирается случайно из [size_min, size_max] по каждой оси
+    size_min: int = 5
+    size_max: int = 8
+    difficulty: int = 1  # сложность первого уровня, дальше растёт на 1 за уровень
+    hp: int = 100
+    atk: int = 2
+    defense: int = 0
+    compact: bool = False  # уровни на CompactGrid
+    view_radius: Optional[int] = None  # None — рисовать всю карту, иначе окно вокруг игрока
+    fov_radius: Optional[int] = None   # None — без тумана войны, иначе радиус обзора (см. FieldOfView)
+    fov_blocking: Tuple[str, ...] = ()  # виды клеток, загораживающие обзор
+
+    def __post_init__(self):
+        # из JSON (сохранение, запись партии) приходит список — конфиг должен оставаться хэшируемым
+        object.__setattr__(self, 'fov_blocking', tuple(self.fov_blocking))
+
+# -----------------------------
+# Команды
+# -----------------------------
+@dataclass(frozen=True)
+class Command:
+    """Разобранная команда. name — ключ в таблицах команд Game,
+    arg — направление для move или индекс для use/equip,
+    error — 'usage' (нет индекса) или 'index' (индекс не число)."""
+    name: str
+    arg: object = None
+    error: Optional[str] = None
+
+COMMAND_ALIASES = {
+    'q': 'quit', 'quit': 'quit', 'exit': 'quit',
+    'map': 'map', 'inv': 'inv', 'stats': 'stats',
+    'hit': 'hit', 'h': 'hit', '': 'hit',
+    'flee': 'flee', 'run': 'flee',
+    'auto': 'auto',
+}
+
+@lru_cache(maxsize=4096)
+def parse_command(text: str) -> Command:
+    """Разбирает ввод один раз; повторяющиеся строки берутся из кэша."""
+    cmd = text.strip().lower()
+    if cmd in DIRS:
+        return Command('move', cmd)
+    name = COMMAND_ALIASES.get(cmd)
+    if name is not None:
+        return Command(name)
+    for prefix in ('use', 'equip'):
+        if cmd.startswith(prefix):
+            parts = cmd.split()
+            if len(parts) < 2:
+                return Command(prefix, error='usage')
+            try:
+                return Command(prefix, int(parts[1]))
+            except ValueError:
+                return Command(prefix, error='index')
+    return Command('unknown')
+
+def parse_yes(text: str) -> bool:
+    return text.strip().lower() == 'y'
+
+def parse_restart(text: str) -> bool:
+    return text.strip() == '1'
+
+# -----------------------------
+# Policy (источник решений)
+# -----------------------------
+class ConsolePolicy:
+    """Решения берутся у живого игрока через input().
+
+    Любой объект с такими же методами можно передать в Game(policy=...),
+    например бота для безголового прогона (см. headless.py).
+    """
+
+    def command(self, game: 'Game') -> str:
+        return input("Ваш ход > ")
+
+    def combat_action(self, game: 'Game', enemy: Enemy) -> str:
+        return input("> ")
+
+    def use_key_on_chest(self, game: 'Game', room: Room) -> bool:
+        return parse_yes(input("> "))
+
+    def restart(self, game: 'Game') -> bool:
+        return parse_restart(input("> "))
+
 # -----------------------------
 # Game engine
 # -----------------------------
 class Game:
-    def __init__(self):
+    def __init__(self, policy=None, out=None, config: Optional[GameConfig] = None,
+                 rng: Optional[random.Random] = None, new_level: bool = True, levels=None, hooks=None):
+        # policy — откуда берутся решения, out — куда идёт вывод (по умолчанию print)
+        # rng — генератор партии, им же генерируются все её подземелья
+        # new_level=False — без первого уровня, dungeon и player выставит вызывающий (см. savegame.py)
+        # levels — готовые уровни по номеру (levels.get(level) -> Dungeon, см. levels.py) вместо генерации
+        # hooks — приёмник событий и замеров времени (см. metrics.py), None — без замеров
+        self.rng = rng if rng is not None else random.Random()
+        self.levels = levels
+        self.hooks = hooks
+        self.config = config if config is not None else GameConfig()
+        self.policy = policy if policy is not None else ConsolePolicy()
+        self.out = out if out is not None else print
+        self.turns = 0
+        self.death_cause = None  # type: Optional[str]  # 'combat' или 'trap'
+        self.death_enemy = None  # type: Optional[str]  # кто убил, если death_cause == 'combat'
+        # какой ответ игра ждёт: 'command', 'combat', 'chest' или 'restart' (см. feed)
+        self.prompt = 'command'
+        self._room = None     # type: Optional[Room]  # комната, о которой вопрос (бой, сундук)
+        self._entered = None  # (dungeon, x, y, вид до входа) — пока не закончили с комнатой
         self.level = 1
         self.dungeon = None  # type: Dungeon
         self.player = None   # type: Player
-        self.init_new_level(self.level)
+        self.fov = None  # type: Optional[FieldOfView]
+        if self.config.fov_radius is not None:
+            self.fov = FieldOfView(self.config.fov_radius, self.config.fov_blocking)
+        self.renderer = MapRenderer(self, radius=self.config.view_radius, fog=self.fov is not None)
+        if new_level:
+            self.init_new_level(self.level)
 
     def init_new_level(self, level:int):
-        print(f"\n--- Переход на уровень {level} ---")
-        n = random.randint(5, 8)
-        m = random.randint(5, 8)
-        self.dungeon = Dungeon(n=n, m=m, difficulty=level)
+        t0 = perf_counter() if self.hooks is not None else 0.0
+        self.out(f"\n--- Переход на уровень {level} ---")
+        cfg = self.config
+        if self.levels is not None:
+            self.dungeon = self.levels.get(level)
+            self.dungeon.rng = self.rng  # дальше (лут с монстров) — генератор партии
+            n, m = self.dungeon.n, self.dungeon.m
+        else:
+            n = self.rng.randint(cfg.size_min, cfg.size_max)
+            m = self.rng.randint(cfg.size_min, cfg.size_max)
+            self.dungeon = Dungeon(n=n, m=m, difficulty=cfg.difficulty + level - 1, rng=self.rng,
+                                   compact=cfg.compact)
         # player starts in center
         sx, sy = n//2, m//2
         if self.player is None:
             # new player
-            self.player = Player(x=sx, y=sy, hp_max=100, hp=100, atk_base=2, def_base=0)
+            self.player = Player(x=sx, y=sy, hp_max=cfg.hp, hp=cfg.hp, atk_base=cfg.atk, def_base=cfg.defense)
         else:
             # keep stats; reposition to center and heal a bit
             self.player.x, self.player.y = sx, sy
             self.player.hp = clamp(self.player.hp + max(5, 10 - level), 0, self.player.hp_max)
         # ensure center is empty
         self.dungeon.grid[sx][sy] = Room(kind='empty')
-        print(f"Размер уровня: {n}x{m}. Вы стартуете в ({sx},{sy}).")
+        self.dungeon.release(sx, sy)
+        self.out(f"Размер уровня: {n}x{m}. Вы стартуете в ({sx},{sy}).")
+        self.look()
         # chance to give a starter consumable each level
-        if random.random() < 0.7:
-            heal = roll(6, 18)
-            potion = Consumable(name='Зелье', desc=f'Восстанавливает {heal} HP', heal=heal)
-            self.player.add_item(potion)
-            print(f"В ваш инвентарь положено стартовое зелье: {potion.name} (+{potion.heal} HP).")
+        if self.rng.random() < 0.7:
+            heal = roll(6, 18, self.rng)
+            starter = potion(heal)
+            self.player.add_item(starter)
+            self.out(f"В ваш инвентарь положено стартовое зелье: {starter.name} (+{starter.heal} HP).")
+        if self.hooks is not None:
+            self.hooks.timing('init_new_level', perf_counter() - t0)
+
+    def look(self):
+        """Обновляет поле зрения для текущей позиции игрока (если туман войны включён)."""
+        if self.fov is not None:
+            self.fov.update(self.dungeon, self.player.x, self.player.y)
 
     def render_map(self, reveal_traps=False):
-        n,m = self.dungeon.n, self.dungeon.m
-        print("\nКарта (P — вы):")
-        for i in range(n):
-            line = []
-            for j in range(m):
-                if (i,j) == (self.player.x, self.player.y):
-                    line.append(SYMBOLS['player'])
-                else:
-                    r = self.dungeon.grid[i][j]
-                    # don't reveal monsters/traps unless explored (or reveal_traps True)
-                    if r.kind == 'monster' and not r.explored:
-                        line.append(SYMBOLS['empty'])
-                    else:
-                        line.append(r.symbol_for_map(reveal_traps=reveal_traps))
-            print(' '.join(line))
-        print()
+        self.look()  # после загрузки сохранения поле зрения ещё не считалось
+        self.out("\nКарта (P — вы):")
+        if self.hooks is None:
+            self.out(self.renderer.render(reveal_traps=reveal_traps))
+        else:
+            self.out(self._timed('render_map', self.renderer.render, reveal_traps))
+        self.out()
+
+    def _timed(self, name: str, fn, *args):
+        t0 = perf_counter()
+        result = fn(*args)
+        self.hooks.timing(name, perf_counter() - t0)
+        return result
 
     def show_status(self):
-        print(f"HP: {self.player.hp}/{self.player.hp_max}  ATK: {self.player.attack_value()}  DEF: {self.player.defense_value()}  Keys: {self.player.keys}  Level: {self.level}  EXP: {self.player.exp}")
+        self.out(f"HP: {self.player.hp}/{self.player.hp_max}  ATK: {self.player.attack_value()}  DEF: {self.player.defense_value()}  Keys: {self.player.keys}  Level: {self.level}  EXP: {self.player.exp}")
 
     def show_inventory(self):
         if not self.player.inventory:
-            print("Инвентарь пуст.")
+            self.out("Инвентарь пуст.")
             return
-        print("Инвентарь:")
-        for idx, it in enumerate(self.player.inventory):
+        self.out("Инвентарь:")
+        for idx, it, count in self.player.inventory.stacks():
             t = type(it).__name__
-            if isinstance(it, Weapon):
-                stat = f"ATK+{it.atk}"
-            elif isinstance(it, Armor):
-                stat = f"DEF+{it.defense}"
-            elif isinstance(it, Consumable):
-                stat = f"HEAL+{it.heal}"
-            else:
-                stat = ''
-            print(f" {idx}: {it.name} ({t}) {stat} — {it.desc}")
-
-    def step(self, cmd:str) -> bool:
-        """Возвращает True если игра продолжается, False если закончилась"""
-        cmd = cmd.strip().lower()
-        if cmd in ('q','quit','exit'):
-            print("Выход из игры.")
-            return False
-        if cmd == 'map':
-            self.render_map()
-            return True
-        if cmd == 'inv':
-            self.show_inventory()
-            return True
-        if cmd.startswith('use'):
-            # use <index>
-            parts = cmd.split()
-            if len(parts) < 2:
-                print("Использование: use <индекс_инвентаря>")
-                return True
-            try:
-                idx = int(parts[1])
-            except:
-                print("Неверный индекс.")
-                return True
-            print(self.player.use_consumable(idx))
+            label = ITEM_STATS.get(type(it))
+            stat = f"{label[0]}+{getattr(it, label[1])}" if label else ''
+            many = f" x{count}" if count > 1 else ''
+            self.out(f" {idx}: {it.name}{many} ({t}) {stat} — {it.desc}")
+
+    def step(self, cmd) -> bool:
+        """Возвращает True если игра продолжается, False если закончилась
+
+        Вопросы внутри хода (бой, сундук, рестарт) задаются policy.
+        """
+        cont = self.feed(cmd)
+        while cont and self.prompt != 'command':
+            cont = self.feed(self.ask())
+        return cont
+
+    def ask(self):
+        """Ответ policy на текущий вопрос self.prompt."""
+        if self.prompt == 'combat':
+            return self.policy.combat_action(self, self._room.enemy)
+        if self.prompt == 'chest':
+            return self.policy.use_key_on_chest(self, self._room)
+        if self.prompt == 'restart':
+            return self.policy.restart(self)
+        return self.policy.command(self)
+
+    def feed(self, answer) -> bool:
+        """Один переход без обращения к policy: ответ на вопрос self.prompt.
+
+        'command' и 'combat' — строка или Command, 'chest' и 'restart' — bool или строка.
+        Возвращает False, если игра закончилась.
+        """
+        if self.hooks is None:
+            cont = self.PROMPTS[self.prompt](self, answer)
+        else:
+            # время хода без ожидания ответа игрока
+            cont = self._timed('step', self.PROMPTS[self.prompt], self, answer)
+        if self._entered is not None and self.prompt not in ('combat', 'chest'):
+            self._leave_room()
+        return cont
+
+    def _answer_command(self, cmd) -> bool:
+        self.turns += 1
+        command = cmd if isinstance(cmd, Command) else parse_command(cmd)
+        if self.hooks is not None:
+            self.hooks.event('command.' + command.name)
+        handler = self.EXPLORE_COMMANDS.get(command.name)
+        if handler is None:
+            self.out("Команда не распознана. w/a/s/d - ход, map - карта, inv - инвентарь, use N, equip N, q - выход")
             return True
-        if cmd.startswith('equip'):
-            parts = cmd.split()
-            if len(parts) < 2:
-                print("Экипировка: equip <индекс_инвентаря>")
-                return True
-            try:
-                idx = int(parts[1])
-            except:
-                print("Неверный индекс.")
-                return True
-            if idx < 0 or idx >= len(self.player.inventory):
-                print("Неверный индекс.")
-                return True
-            item = self.player.inventory.pop(idx)
-            print(self.player.equip(item))
+        return handler(self, command)
+
+    # -----------------------------
+    # команды (общие для исследования и боя)
+    # -----------------------------
+    def _use(self, cmd: Command, usage: str):
+        if cmd.error == 'usage':
+            self.out(usage)
+        elif cmd.error:
+            self.out("Неверный индекс.")
+        else:
+            self.out(self.player.use_consumable(cmd.arg))
+
+    def _equip(self, cmd: Command, usage: str):
+        if cmd.error == 'usage':
+            self.out(usage)
+        elif cmd.error or cmd.arg not in self.player.inventory:
+            self.out("Неверный индекс.")
+        else:
+            item = self.player.inventory.take(cmd.arg)
+            self.out(self.player.equip(item))
+
+    def _cmd_quit(self, cmd: Command) -> bool:
+        self.out("Выход из игры.")
+        return False
+
+    def _cmd_map(self, cmd: Command) -> bool:
+        self.render_map()
+        return True
+
+    def _cmd_inv(self, cmd: Command) -> bool:
+        self.show_inventory()
+        return True
+
+    def _cmd_use(self, cmd: Command) -> bool:
+        self._use(cmd, "Использование: use <индекс_инвентаря>")
+        return True
+
+    def _cmd_equip(self, cmd: Command) -> bool:
+        self._equip(cmd, "Экипировка: equip <индекс_инвентаря>")
+        return True
+
+    def _cmd_move(self, cmd: Command) -> bool:
+        dx, dy = DIRS[cmd.arg]
+        nx = self.player.x + dx
+        ny = self.player.y + dy
+        if not (0 <= nx < self.dungeon.n and 0 <= ny < self.dungeon.m):
+            self.out("Нельзя идти в эту сторону — граница уровня.")
             return True
-        # movement
-        if cmd in DIRS:
-            dx, dy = DIRS[cmd]
-            nx = self.player.x + dx
-            ny = self.player.y + dy
-            if not (0 <= nx < self.dungeon.n and 0 <= ny < self.dungeon.m):
-                print("Нельзя идти в эту сторону — граница уровня.")
-                return True
-            # move
-            self.player.x, self.player.y = nx, ny
-            room = self.dungeon.grid[nx][ny]
-            room.explored = True
-            # handle room
+        # move
+        self.player.x, self.player.y = nx, ny
+        self.look()
+        room = self.dungeon.grid[nx][ny]
+        room.explored = True
+        # handle room (клетку обновит _leave_room, когда бой или вопрос про сундук закончатся)
+        self._entered = (self.dungeon, nx, ny, room.kind)
+        if self.hooks is None:
             return self.handle_room(room)
-        print("Команда не распознана. w/a/s/d - ход, map - карта, inv - инвентарь, use N, equip N, q - выход")
-        return True
+        self.hooks.event('room.' + room.kind)
+        return self._timed('handle_room', self.handle_room, room)
+
+    def _leave_room(self):
+        dungeon, x, y, kind = self._entered
+        self._entered = None
+        room = dungeon.grid[x][y]
+        dungeon.mark_dirty(x, y, kind_changed=room.kind != kind)
+        if room.kind == 'empty' and dungeon is self.dungeon:
+            # содержимое забрано — клетка снова свободна
+            dungeon.release(x, y)
 
+    EXPLORE_COMMANDS = {
+        'quit': _cmd_quit,
+        'map': _cmd_map,
+        'inv': _cmd_inv,
+        'use': _cmd_use,
+        'equip': _cmd_equip,
+        'move': _cmd_move,
+    }
     def handle_room(self, room: Room) -> bool:
         # if portal
         if room.kind == 'portal':
             if room.portal_enabled:
-                print("Вы вошли в портал! Переход на следующий уровень...")
+                self.out("Вы вошли в портал! Переход на следующий уровень...")
                 self.level += 1
                 self.init_new_level(self.level)
                 # regenerate dungeon and continue
                 return True
             else:
-                print("Вы видите портал, но он неактивен — нужен ключ.")
+                self.out("Вы видите портал, но он неактивен — нужен ключ.")
                 return True
         if room.kind == 'key':
-            print("Вы нашли ключ! Добавлен в инвентарь.")
+            self.out("Вы нашли ключ! Добавлен в инвентарь.")
             self.player.keys += 1
             room.kind = 'empty'
             # Reveal portal
             self.dungeon.reveal_portal_if_key()
             return True
         if room.kind == 'empty':
-            print("Пустая комната.")
+            self.out("Пустая комната.")
             return True
         if room.kind == 'chest':
             # open chest
             if room.chest_locked:
                 if self.player.keys > 0:
-                    print("Сундук заперт. У вас есть ключ. Использовать ключ? (y/n)")
-                    ans = input("> ").strip().lower()
-                    if ans == 'y':
-                        self.player.keys -= 1
-                        print("Вы открыли сундук ключом.")
-                        found = room.chest_contents
-                        for it in found:
-                            print(f" - найдено: {it.name} — {it.desc}")
-                            self.player.add_item(it)
-                        room.kind = 'empty'
-                        room.chest_contents = []
-                        return True
-                    else:
-                        print("Вы оставили сундук закрытым.")
-                        return True
+                    self.out("Сундук заперт. У вас есть ключ. Использовать ключ? (y/n)")
+                    self.prompt, self._room = 'chest', room
+                    return True
                 else:
-                    print("Сундук заперт, но у вас нет ключа.")
+                    self.out("Сундук заперт, но у вас нет ключа.")
                     return True
             else:
-                print("Вы открыли сундук.")
+                self.out("Вы открыли сундук.")
                 if not room.chest_contents:
-                    print("Сундук пуст.")
+                    self.out("Сундук пуст.")
                     room.kind = 'empty'
                     return True
                 for it in room.chest_contents:
-                    print(f" - найдено: {it.name} — {it.desc}")
+                    self.out(f" - найдено: {it.name} — {it.desc}")
                     self.player.add_item(it)
                 room.kind = 'empty'
                 room.chest_contents = []
@@ -465,145 +1316,278 @@ class Game:
         if room.kind == 'trap':
             # hidden traps might be unseen until explored; damage when stepped
             dmg = room.trap_damage
-            print(f"Ловушка! Вы получили {dmg} единиц урона.")
+            self.out(f"Ловушка! Вы получили {dmg} единиц урона.")
             real_dmg = self.player.take_damage(dmg)
-            print(f"Фактический урон с учётом брони: {real_dmg}. Текущее HP: {self.player.hp}/{self.player.hp_max}")
+            self.out(f"Фактический урон с учётом брони: {real_dmg}. Текущее HP: {self.player.hp}/{self.player.hp_max}")
             room.kind = 'empty'  # одноразовая
             if not self.player.is_alive():
-                print("Вы погибли в ловушке.")
+                self.out("Вы погибли в ловушке.")
+                self.death_cause = 'trap'
                 return self.game_over()
             return True
         if room.kind == 'monster':
             e = room.enemy
             if e is None:
-                print("Комната пуста (монстр уже побеждён).")
+                self.out("Комната пуста (монстр уже побеждён).")
                 room.kind = 'empty'
                 return True
-            print(f"В комнате — {e.name}! (HP {e.hp}, ATK {e.atk}, DEF {e.defense})")
-            # combat loop
-            while e.is_alive() and self.player.is_alive():
-                print("\nВыберите действие: hit (атака), flee (убежать), stats (статусы), inv, equip, use N")
-                action = input("> ").strip().lower()
-                if action in ('hit', 'h', ''):
-                    # player attack
-                    atk = self.player.attack_value()
-                    dmg_dealt = e.take_damage(atk)
-                    print(f"Вы атакуете (`{atk}`) и наносите {dmg_dealt} урона. Монстр HP: {max(0,e.hp)}")
-                    if not e.is_alive():
-                        print(f"Вы победили {e.name}! Получено {e.exp} опыта.")
-                        self.player.exp += e.exp
-                        # maybe drop loot
-                        if random.random() < 0.5:
-                            loot = self.dungeon.generate_loot()
-                            for it in loot:
-                                self.player.add_item(it)
-                                print(f"Добыча: {it.name} — {it.desc}")
-                        room.enemy = None
-                        room.kind = 'empty'
-                        break
-                elif action.startswith('use'):
-                    parts = action.split()
-                    if len(parts) >= 2:
-                        try:
-                            idx = int(parts[1])
-                            print(self.player.use_consumable(idx))
-                        except:
-                            print("Неверный индекс.")
-                    else:
-                        print("use <индекс>")
-                    continue
-                elif action.startswith('equip'):
-                    parts = action.split()
-                    if len(parts) >= 2:
-                        try:
-                            idx = int(parts[1])
-                            if idx < 0 or idx >= len(self.player.inventory):
-                                print("Неверный индекс.")
-                            else:
-                                item = self.player.inventory.pop(idx)
-                                print(self.player.equip(item))
-                        except:
-                            print("Неверный индекс.")
-                    else:
-                        print("equip <индекс>")
-                    continue
-                elif action in ('flee','run'):
-                    # attempt to flee: chance depends on enemy and player
-                    chance = 50 + (self.player.attack_value() - e.atk)*5
-                    if random.randint(1,100) <= clamp(chance, 10, 90):
-                        print("Вам удалось убежать!")
-                        # move player back to previous position if possible — we don't track previous easily; instead randomly step to adjacent safe cell
-                        moved = self.safe_step_out()
-                        return True
-                    else:
-                        print("Не удалось убежать.")
-                elif action == 'stats':
-                    self.show_status()
-                    print(f"Монстр: {e.name} HP={e.hp}, ATK={e.atk}, DEF={e.defense}")
-                    continue
-                elif action == 'inv':
-                    self.show_inventory()
-                    continue
-                else:
-                    print("Неизвестное действие.")
-                    continue
-                # if monster still alive, it attacks
-                if e.is_alive():
-                    dmg = e.atk
-                    taken = self.player.take_damage(dmg)
-                    print(f"Монстр атакует! Вы получили {taken} урона. HP: {self.player.hp}/{self.player.hp_max}")
-                if not self.player.is_alive():
-                    print("Вы погибли в бою.")
-                    return self.game_over()
+            self.out(f"В комнате — {e.name}! (HP {e.hp}, ATK {e.atk}, DEF {e.defense})")
+            # combat: дальше ходы идут через feed с prompt == 'combat'
+            if e.is_alive() and self.player.is_alive():
+                self._combat_prompt(room)
             return True
-        print("Что-то непонятное в комнате.")
+        self.out("Что-то непонятное в комнате.")
+        return True
+
+    def _answer_chest(self, use) -> bool:
+        room = self._room
+        self.prompt, self._room = 'command', None
+        if isinstance(use, str):
+            use = parse_yes(use)
+        if use:
+            self.player.keys -= 1
+            self.out("Вы открыли сундук ключом.")
+            found = room.chest_contents
+            for it in found:
+                self.out(f" - найдено: {it.name} — {it.desc}")
+                self.player.add_item(it)
+            room.kind = 'empty'
+            room.chest_contents = []
+        else:
+            self.out("Вы оставили сундук закрытым.")
         return True
 
+    # -----------------------------
+    # бой
+    # -----------------------------
+    # что сделало действие в бою: ход не потрачен / ход потрачен (монстр бьёт в ответ) / бой окончен
+    FREE, TURN, END = 'free', 'turn', 'end'
+
+    def _combat_prompt(self, room: Room):
+        self.out("\nВыберите действие: hit (атака), auto (автобой), flee (убежать), stats (статусы), inv, equip, use N")
+        self.prompt, self._room = 'combat', room
+
+    def _answer_combat(self, action) -> bool:
+        room = self._room
+        cmd = action if isinstance(action, Command) else parse_command(action)
+        if self.hooks is None:
+            result = self.combat_step(room, cmd)
+        else:
+            self.hooks.event('combat.' + cmd.name)
+            result = self._timed('combat_turn', self.combat_step, room, cmd)
+        if result is None:
+            self._combat_prompt(room)
+            return True
+        if self.prompt == 'combat':  # при смерти game_over уже спросил про рестарт
+            self.prompt, self._room = 'command', None
+        return result
+
+    def combat_step(self, room: Room, cmd: Command) -> Optional[bool]:
+        """Одно действие в бою. None — бой продолжается, иначе результат handle_room."""
+        e = room.enemy
+        handler = self.COMBAT_COMMANDS.get(cmd.name)
+        if handler is None:
+            self.out("Неизвестное действие.")
+            return None
+        outcome = handler(self, room, e, cmd)
+        if outcome == self.END:
+            return True
+        if outcome == self.FREE:
+            return None
+        # if monster still alive, it attacks
+        if e.is_alive():
+            dmg = e.atk
+            taken = self.player.take_damage(dmg)
+            self.out(f"Монстр атакует! Вы получили {taken} урона. HP: {self.player.hp}/{self.player.hp_max}")
+        if not self.player.is_alive():
+            self.out("Вы погибли в бою.")
+            self.death_cause, self.death_enemy = 'combat', e.name
+            return self.game_over()
+        return None
+
+    def _fight_hit(self, room: Room, e: Enemy, cmd: Command) -> str:
+        # player attack
+        atk = self.player.attack_value()
+        dmg_dealt = e.take_damage(atk)
+        self.out(f"Вы атакуете (`{atk}`) и наносите {dmg_dealt} урона. Монстр HP: {max(0,e.hp)}")
+        if e.is_alive():
+            return self.TURN
+        return self._win_fight(room, e)
+
+    def _fight_auto(self, room: Room, e: Enemy, cmd: Command) -> str:
+        # весь бой сразу: исход считается в замкнутой форме (combat.py)
+        fight = predict(self.player, e)
+        if not fight.win:
+            if fight.turns is None:
+                self.out("Автобой бесполезен: никто никого не ранит.")
+            else:
+                self.out(f"Автобой не советуем: вы погибнете через {fight.turns} ударов.")
+            return self.FREE
+        e.hp -= fight.turns * max(0, self.player.attack_value() - e.defense)
+        self.player.hp = fight.hp_left
+        self.out(f"Автобой: {fight.turns} ударов, получено {fight.damage_taken} урона. HP: {self.player.hp}/{self.player.hp_max}")
+        return self._win_fight(room, e)
+
+    def _win_fight(self, room: Room, e: Enemy) -> str:
+        self.out(f"Вы победили {e.name}! Получено {e.exp} опыта.")
+        self.player.exp += e.exp
+        # maybe drop loot
+        if self.rng.random() < 0.5:
+            loot = self.dungeon.generate_loot()
+            for it in loot:
+                self.player.add_item(it)
+                self.out(f"Добыча: {it.name} — {it.desc}")
+        room.enemy = None
+        room.kind = 'empty'
+        return self.END
+
+    def _fight_flee(self, room: Room, e: Enemy, cmd: Command) -> str:
+        # attempt to flee: chance depends on enemy and player
+        chance = 50 + (self.player.attack_value() - e.atk)*5
+        if self.rng.randint(1,100) <= clamp(chance, 10, 90):
+            self.out("Вам удалось убежать!")
+            # move player back to previous position if possible — we don't track previous easily; instead randomly step to adjacent safe cell
+            self.safe_step_out()
+            return self.END
+        self.out("Не удалось убежать.")
+        return self.TURN
+
+    def _fight_use(self, room: Room, e: Enemy, cmd: Command) -> str:
+        self._use(cmd, "use <индекс>")
+        return self.FREE
+
+    def _fight_equip(self, room: Room, e: Enemy, cmd: Command) -> str:
+        self._equip(cmd, "equip <индекс>")
+        return self.FREE
+
+    def _fight_stats(self, room: Room, e: Enemy, cmd: Command) -> str:
+        self.show_status()
+        self.out(f"Монстр: {e.name} HP={e.hp}, ATK={e.atk}, DEF={e.defense}")
+        return self.FREE
+
+    def _fight_inv(self, room: Room, e: Enemy, cmd: Command) -> str:
+        self.show_inventory()
+        return self.FREE
+
+    COMBAT_COMMANDS = {
+        'hit': _fight_hit,
+        'auto': _fight_auto,
+        'flee': _fight_flee,
+        'use': _fight_use,
+        'equip': _fight_equip,
+        'stats': _fight_stats,
+        'inv': _fight_inv,
+    }
+
     def safe_step_out(self) -> bool:
-        # try to step to any adjacent cell that is inside bounds
+        # step to an adjacent in-bounds cell, preferring ones without a monster or trap
+        options = []
         for dx,dy in DIRS.values():
             nx = self.player.x + dx
             ny = self.player.y + dy
             if 0 <= nx < self.dungeon.n and 0 <= ny < self.dungeon.m:
-                self.player.x, self.player.y = nx, ny
-                return True
+                options.append((nx, ny))
+        safe = [(x, y) for x, y in options if self.dungeon.grid[x][y].kind not in ('monster', 'trap')]
+        if safe or options:
+            self.player.x, self.player.y = (safe or options)[0]
+        self.look()
         return True
 
     def game_over(self) -> bool:
-        print("\n=== Игра окончена ===")
-        print("1) Начать заново")
-        print("2) Выйти")
-        ans = input("> ").strip()
-        if ans == '1':
+        self.out("\n=== Игра окончена ===")
+        self.out("1) Начать заново")
+        self.out("2) Выйти")
+        if self.hooks is not None:
+            self.hooks.event('game_over')
+        self.prompt, self._room = 'restart', None
+        return True
+
+    def _answer_restart(self, again) -> bool:
+        if isinstance(again, str):
+            again = parse_restart(again)
+        if again:
             # reset everything
-            self.__init__()
+            self.__init__(policy=self.policy, out=self.out, config=self.config, rng=self.rng,
+                          levels=self.levels, hooks=self.hooks)
             return True
         else:
-            print("До свидания!")
-            sys.exit(0)
+            self.out("До свидания!")
+            return False
 
-    def main_loop(self):
-        print("Добро пожаловать в Dungeon Crawler!")
-        print("Команды: w/a/s/d - ходы; map - карта; inv - инвентарь; use N - применить расходник; equip N - экипировать; q - выйти")
+    PROMPTS = {
+        'command': _answer_command,
+        'combat': _answer_combat,
+        'chest': _answer_chest,
+        'restart': _answer_restart,
+    }
+
+    def main_loop(self, ansi=False):
+        # ansi=True — карта закреплена вверху терминала и дорисовывается по клеткам
+        self.out("Добро пожаловать в Dungeon Crawler!")
+        self.out("Команды: w/a/s/d - ходы; map - карта; inv - инвентарь; use N - применить расходник; equip N - экипировать; q - выйти")
         while True:
             self.show_status()
-            self.render_map()
-            cmd = input("Ваш ход > ")
+            if ansi:
+                self.look()  # как render_map: после загрузки сохранения поле зрения ещё не считалось
+                frame = (self.renderer.render_ansi() if self.hooks is None
+                         else self._timed('render_map', self.renderer.render_ansi))
+                self.out(frame, end='', flush=True)
+            else:
+                self.render_map()
+            cmd = self.policy.command(self)
             cont = self.step(cmd)
             if not cont:
                 break
+        if ansi:
+            self.out('\x1b[r', end='')
 
 # -----------------------------
 # Запуск
 # -----------------------------
 if __name__ == "__main__":
     # Чтобы игра была чуть более предсказуемой при отладке, можно передать семя через аргументы
+    # --ansi — перерисовывать только изменившиеся клетки карты
+    # --radius=N — показывать только окно вокруг игрока
+    # --fov=N — туман войны: видно только на N клеток вокруг (см. FieldOfView)
+    args = [a for a in sys.argv[1:] if not a.startswith('--')]
     seed = None
-    if len(sys.argv) >= 2:
+    if len(args) >= 1:
         try:
-            seed = int(sys.argv[1])
-            random.seed(seed)
+            seed = int(args[0])
         except:
             pass
-    game = Game()
-    game.main_loop()
+    # --record=PATH — записать партию для воспроизведения (см. replay.py)
+    # --pregen — готовить следующий уровень в фоне (см. levels.py)
+    # --metrics=PATH — по выходе сохранить счётчики и замеры времени в JSON (см. metrics.py)
+    radius = None
+    fov_radius = None
+    record_path = None
+    metrics_path = None
+    for a in sys.argv[1:]:
+        if a.startswith('--radius='):
+            radius = int(a.split('=', 1)[1])
+        elif a.startswith('--fov='):
+            fov_radius = int(a.split('=', 1)[1])
+        elif a.startswith('--record='):
+            record_path = a.split('=', 1)[1]
+        elif a.startswith('--metrics='):
+            metrics_path = a.split('=', 1)[1]
+    config = GameConfig(view_radius=radius, fov_radius=fov_radius)
+    ansi = '--ansi' in sys.argv[1:]
+    if record_path:
+        import replay
+        replay.record(record_path, seed=seed, config=config, ansi=ansi)
+    elif '--pregen' in sys.argv[1:]:
+        import levels
+        levels.play(seed=seed, config=config, ansi=ansi)
+    else:
+        hooks = None
+        if metrics_path:
+            from metrics import Metrics
+            hooks = Metrics()
+        game = Game(rng=random.Random(seed), config=config, hooks=hooks)
+        try:
+            game.main_loop(ansi=ansi)
+        finally:
+            if hooks is not None:
+                hooks.dump(metrics_path)
@@ -0,0 +1,76 @@
+"""
+Бой в замкнутой форме: исход автобоя без пошагового цикла.
+
+Урон детерминирован: игрок бьёт первым на max(0, ATK - DEF врага), враг,
+если жив, отвечает на max(0, ATK врага - DEF игрока). Значит, число
+ударов до победы — ceil(HP врага / урон), а полученный урон — удары
+врага между ними.
+
+    fight = auto_fight(p_atk=5, p_def=1, p_hp=40, e_hp=12, e_atk=6, e_def=1)
+    fight.win, fight.turns, fight.damage_taken
+    fight_batch(atks[:, None], defs[:, None], hps[:, None], e_hp, e_atk, e_def)  # сетка матчей
+
+fight_batch работает на массивах NumPy, если он установлен, иначе — на списках.
+"""
+from __future__ import annotations
+from dataclasses import dataclass
+from typing import Dict, Optional
+
+try:
+    import numpy as np
+except ImportError:  # numpy нужен только для быстрого fight_batch
+    np = None
+
+@dataclass(frozen=True)
+class FightOutcome:
+    win: bool
+    turns: Optional[int]  # ударов игрока до конца боя; None — бой бесконечен (никто никого не ранит)
+    damage_taken: int     # урон, полученный игроком
+    hp_left: int          # HP игрока после боя (<= 0 — погиб)
+
+def _ceil_div(a: int, b: int) -> int:
+    return -(-a // b)
+
+def auto_fight(p_atk: int, p_def: int, p_hp: int, e_hp: int, e_atk: int, e_def: int) -> FightOutcome:
+    dealt = max(0, p_atk - e_def)
+    taken = max(0, e_atk - p_def)
+    to_kill = max(1, _ceil_div(e_hp, dealt)) if dealt > 0 else None
+    to_die = _ceil_div(p_hp, taken) if taken > 0 else None
+    # враг отвечает после каждого удара, кроме последнего
+    if to_kill is not None and (to_die is None or to_kill - 1 < to_die):
+        damage = (to_kill - 1) * taken
+        return FightOutcome(True, to_kill, damage, p_hp - damage)
+    if to_die is None:
+        return FightOutcome(False, None, 0, p_hp)
+    return FightOutcome(False, to_die, to_die * taken, p_hp - to_die * taken)
+
+def predict(player, enemy) -> FightOutcome:
+    """Исход автобоя игрока (Player) с врагом (Enemy) из текущего состояния."""
+    return auto_fight(player.attack_value(), player.defense_value(), player.hp,
+                      enemy.hp, enemy.atk, enemy.defense)
+
+def fight_batch(p_atk, p_def, p_hp, e_hp, e_atk, e_def) -> Dict[str, object]:
+    """auto_fight для многих матчей сразу.
+
+    С NumPy аргументы — массивы (или числа) с общим broadcasting, например
+    игроки по строкам (shape (P, 1)) и враги по столбцам (shape (E,)).
+    Без NumPy — списки одинаковой длины. Возвращает 'win', 'turns'
+    (-1 — бой бесконечен), 'damage_taken', 'hp_left'.
+    """
+    if np is None:
+        rows = [auto_fight(*args) for args in zip(p_atk, p_def, p_hp, e_hp, e_atk, e_def)]
+        return {'win': [r.win for r in rows],
+                'turns': [-1 if r.turns is None else r.turns for r in rows],
+                'damage_taken': [r.damage_taken for r in rows],
+                'hp_left': [r.hp_left for r in rows]}
+    p_atk, p_def, p_hp, e_hp, e_atk, e_def = (np.asarray(a, dtype=np.int64)
+                                              for a in (p_atk, p_def, p_hp, e_hp, e_atk, e_def))
+    dealt = np.maximum(0, p_atk - e_def)
+    taken = np.maximum(0, e_atk - p_def)
+    to_kill = np.maximum(1, -(-e_hp // np.maximum(dealt, 1)))
+    to_die = -(-p_hp // np.maximum(taken, 1))
+    win = (dealt > 0) & ((taken == 0) | (to_kill - 1 < to_die))
+    lose_turns = np.where(taken > 0, to_die, -1)
+    turns = np.where(win, to_kill, lose_turns)
+    damage = np.where(win, (to_kill - 1) * taken, np.where(taken > 0, to_die * taken, 0))
+    return {'win': win, 'turns': turns, 'damage_taken': damage, 'hp_left': p_hp - damage}
@@ -0,0 +1,211 @@
+"""
+Безголовый режим: партии играет бот, вывод уходит в никуда.
+Нужен для баланса — гоняем тысячи партий с фиксированными семенами.
+
+    python headless.py 10000 --seed 0
+"""
+from __future__ import annotations
+import argparse
+import random
+import time
+from collections import Counter
+from dataclasses import dataclass, field
+from typing import Callable, Dict, Optional
+
+from bettercode import DIRS, Armor, Consumable, Game, GameConfig, Weapon
+from combat import predict
+from metrics import Metrics
+from pathfinding import PathFinder
+
+def null_sink(*args, **kwargs):
+    pass
+
+# -----------------------------
+# Бот
+# -----------------------------
+class BotPolicy:
+    """Простой бот: лечится при низком HP, надевает лучшее снаряжение,
+    идёт к ключу, потом к порталу, иногда сворачивает в случайную сторону."""
+
+    def __init__(self, seed: Optional[int] = None, wander: float = 0.3, heal_below: float = 0.4):
+        self.rng = random.Random(seed)
+        self.wander = wander
+        self.heal_below = heal_below
+
+    def _heal_cmd(self, game: Game) -> Optional[str]:
+        p = game.player
+        if p.hp >= p.hp_max * self.heal_below:
+            return None
+        for idx in p.inventory.of_type(Consumable):
+            return f'use {idx}'
+        return None
+
+    def _equip_cmd(self, game: Game) -> Optional[str]:
+        p = game.player
+        for idx, it in p.inventory.of_type(Weapon).items():
+            if p.weapon is None or it.atk > p.weapon.atk:
+                return f'equip {idx}'
+        for idx, it in p.inventory.of_type(Armor).items():
+            if p.armor is None or it.defense > p.armor.defense:
+                return f'equip {idx}'
+        return None
+
+    def command(self, game: Game) -> str:
+        cmd = self._heal_cmd(game) or self._equip_cmd(game)
+        if cmd:
+            return cmd
+        d = game.dungeon
+        px, py = d.portal_pos
+        target = d.portal_pos if d.grid[px][py].portal_enabled else d.key_pos
+        return self.move(game, target)
+
+    def move(self, game: Game, target) -> str:
+        p, d = game.player, game.dungeon
+        tx, ty = target
+        moves = []
+        if tx < p.x: moves.append('w')
+        if tx > p.x: moves.append('s')
+        if ty < p.y: moves.append('a')
+        if ty > p.y: moves.append('d')
+        if not moves or self.rng.random() < self.wander:
+            moves = [k for k, (dx, dy) in DIRS.items()
+                     if 0 <= p.x + dx < d.n and 0 <= p.y + dy < d.m]
+        return self.rng.choice(moves)
+
+    def combat_action(self, game: Game, enemy) -> str:
+        # если пробить броню нельзя, бой бесконечен — убегаем
+        if game.player.attack_value() <= enemy.defense:
+            return 'flee'
+        heal = self._heal_cmd(game)
+        if heal:
+            return heal
+        # выигрышный бой проводим целиком, иначе бьём по удару (вдруг понадобится зелье)
+        return 'auto' if predict(game.player, enemy).win else 'hit'
+
+    def use_key_on_chest(self, game: Game, room) -> bool:
+        # ключ нужнее для портала
+        return False
+
+    def restart(self, game: Game) -> bool:
+        return False
+
+class PathBotPolicy(BotPolicy):
+    """BotPolicy, который идёт к цели кратчайшим путём в обход ловушек и монстров,
+    а если обхода нет — самым дешёвым путём через них."""
+
+    def __init__(self, seed: Optional[int] = None, **kwargs):
+        super().__init__(seed, **kwargs)
+        self.paths: Optional[PathFinder] = None
+
+    def move(self, game: Game, target) -> str:
+        if self.paths is None or self.paths.dungeon is not game.dungeon:
+            self.paths = PathFinder(game.dungeon)
+        src = (game.player.x, game.player.y)
+        step = self.paths.next_step(src, target)
+        if step is None:
+            path = self.paths.path(src, target)
+            if not path:
+                return super().move(game, target)
+            x, y = path[0]
+            step = next(k for k, v in DIRS.items() if v == (x - src[0], y - src[1]))
+        return step
+
+POLICIES = {'simple': BotPolicy, 'path': PathBotPolicy}
+
+# -----------------------------
+# Прогон
+# -----------------------------
+@dataclass
+class GameResult:
+    seed: int
+    depth: int
+    turns: int
+    cause: str  # 'combat', 'trap', 'timeout' или 'quit'
+    exp: int
+    enemy: Optional[str] = None  # кто убил, если cause == 'combat'
+
+def play_game(seed: int, policy=None, max_turns: int = 2000,
+              config: Optional[GameConfig] = None, hooks=None) -> GameResult:
+    if policy is None:
+        policy = BotPolicy(seed)
+    game = Game(policy=policy, out=null_sink, config=config, rng=random.Random(seed), hooks=hooks)
+    while game.turns < max_turns:
+        if not game.step(policy.command(game)):
+            break
+    if game.death_cause is not None:
+        cause = game.death_cause
+    elif game.turns >= max_turns:
+        cause = 'timeout'
+    else:
+        cause = 'quit'
+    return GameResult(seed=seed, depth=game.level, turns=game.turns, cause=cause, exp=game.player.exp,
+                      enemy=game.death_enemy)
+
+@dataclass
+class BatchStats:
+    games: int = 0
+    total_turns: int = 0
+    total_depth: int = 0
+    max_depth: int = 0
+    depths: Counter = field(default_factory=Counter)
+    causes: Counter = field(default_factory=Counter)
+    killers: Counter = field(default_factory=Counter)  # имена врагов, убивших игрока
+
+    def add(self, r: GameResult):
+        self.games += 1
+        self.total_turns += r.turns
+        self.total_depth += r.depth
+        self.max_depth = max(self.max_depth, r.depth)
+        self.depths[r.depth] += 1
+        self.causes[r.cause] += 1
+        if r.enemy is not None:
+            self.killers[r.enemy] += 1
+
+    def merge(self, other: 'BatchStats'):
+        self.games += other.games
+        self.total_turns += other.total_turns
+        self.total_depth += other.total_depth
+        self.max_depth = max(self.max_depth, other.max_depth)
+        self.depths.update(other.depths)
+        self.causes.update(other.causes)
+        self.killers.update(other.killers)
+
+    def as_dict(self) -> Dict:
+        g = self.games or 1
+        return {
+            'games': self.games,
+            'mean_depth': round(self.total_depth / g, 3),
+            'max_depth': self.max_depth,
+            'mean_turns': round(self.total_turns / g, 3),
+            'depths': dict(sorted(self.depths.items())),
+            'causes': dict(self.causes.most_common()),
+            'killers': dict(self.killers.most_common()),
+        }
+
+def run_batch(n: int, seed: int = 0, policy_factory: Callable[[int], object] = BotPolicy,
+              max_turns: int = 2000, config: Optional[GameConfig] = None, hooks=None) -> BatchStats:
+    """Играет n партий с семенами seed..seed+n-1 и собирает статистику."""
+    stats = BatchStats()
+    for s in range(seed, seed + n):
+        stats.add(play_game(s, policy_factory(s), max_turns=max_turns, config=config, hooks=hooks))
+    return stats
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser(description="Безголовый прогон партий")
+    ap.add_argument('games', type=int, nargs='?', default=1000)
+    ap.add_argument('--seed', type=int, default=0)
+    ap.add_argument('--max-turns', type=int, default=2000)
+    ap.add_argument('--bot', choices=sorted(POLICIES), default='simple')
+    ap.add_argument('--metrics', help='сохранить счётчики и замеры времени в JSON')
+    args = ap.parse_args()
+
+    hooks = Metrics() if args.metrics else None
+    t0 = time.perf_counter()
+    stats = run_batch(args.games, seed=args.seed, max_turns=args.max_turns, policy_factory=POLICIES[args.bot],
+                      hooks=hooks)
+    dt = time.perf_counter() - t0
+    for k, v in stats.as_dict().items():
+        print(f"{k}: {v}")
+    print(f"Время: {dt:.2f} c ({args.games / dt * 60:.0f} партий/мин)")
+    if hooks is not None:
+        hooks.dump(args.metrics)
@@ -0,0 +1,134 @@
+"""
+Уровни заранее: следующий уровень генерируется в фоне, пока игрок
+исследует текущий, а готовые подземелья лежат в LRU-кэше.
+
+Чтобы уровень можно было построить заранее, он не должен зависеть от
+бросков во время игры: у каждого уровня своё семя, выведенное из семени
+партии и номера уровня. Кэш хранит эталонные подземелья по ключу
+(семя, размер, сложность, compact) и отдаёт их копии — повторное семя
+не генерируется заново.
+
+    levels = LevelFactory(seed=42, config=cfg)
+    game = Game(config=cfg, rng=random.Random(42), levels=levels)
+    ...
+    levels.close()
+
+Генерация — чистый Python, поэтому поток ускоряет переходы, пока игрок
+думает над ходом; для параллельной работы можно передать
+executor=ProcessPoolExecutor().
+"""
+from __future__ import annotations
+import random
+import sys
+import time
+from collections import OrderedDict
+from concurrent.futures import Executor, Future, ThreadPoolExecutor
+from typing import Dict, Optional, Tuple
+
+from bettercode import Dungeon, Game, GameConfig
+
+Key = Tuple[int, int, int, int, bool]  # (семя уровня, n, m, сложность, compact)
+
+def level_seed(seed: int, level: int) -> int:
+    return (seed * 1000003 + level) & 0xFFFFFFFFFFFF
+
+def level_key(seed: int, level: int, config: GameConfig) -> Key:
+    """Ключ уровня; размеры тоже выбрасываются из семени уровня."""
+    s = level_seed(seed, level)
+    rng = random.Random(s)
+    n = rng.randint(config.size_min, config.size_max)
+    m = rng.randint(config.size_min, config.size_max)
+    return s, n, m, config.difficulty + level - 1, config.compact
+
+def build(key: Key) -> Dungeon:
+    s, n, m, difficulty, compact = key
+    return Dungeon(n=n, m=m, seed=s, difficulty=difficulty, compact=compact)
+
+def _build_pair(key: Key) -> Tuple[Dungeon, Dungeon]:
+    # эталон для кэша и копия для игрока — обе готовятся в фоне
+    master = build(key)
+    return master, master.copy()
+
+class LevelFactory:
+    def __init__(self, seed: int, config: Optional[GameConfig] = None, ahead: int = 1,
+                 cache_size: int = 8, executor: Optional[Executor] = None):
+        # ahead — сколько следующих уровней готовить заранее
+        self.seed = seed
+        self.config = config if config is not None else GameConfig()
+        self.ahead = ahead
+        self.cache_size = cache_size
+        self.cache: 'OrderedDict[Key, Dungeon]' = OrderedDict()
+        self.pending: Dict[Key, Future] = {}
+        self._own_executor = executor is None
+        self.executor = executor if executor is not None else ThreadPoolExecutor(1, thread_name_prefix='levels')
+        self.hits = self.waits = self.misses = 0
+
+    def get(self, level: int) -> Dungeon:
+        """Подземелье уровня level (своя копия) и заказ следующих."""
+        key = level_key(self.seed, level, self.config)
+        master = self.cache.get(key)
+        if master is not None:
+            self.cache.move_to_end(key)
+            self.hits += 1
+        else:
+            fut = self.pending.pop(key, None)
+            if fut is not None:
+                master, ready = fut.result()
+                self.waits += 1
+            else:
+                master, ready = build(key), None
+                self.misses += 1
+            self._store(key, master)
+            if ready is not None:
+                self.prefetch(level + 1)
+                return ready
+        self.prefetch(level + 1)
+        return master.copy()
+
+    def prefetch(self, level: int):
+        for lv in range(level, level + self.ahead):
+            key = level_key(self.seed, lv, self.config)
+            if key not in self.cache and key not in self.pending:
+                self.pending[key] = self.executor.submit(_build_pair, key)
+
+    def _store(self, key: Key, master: Dungeon):
+        self.cache[key] = master
+        while len(self.cache) > self.cache_size:
+            self.cache.popitem(last=False)
+
+    def close(self):
+        for fut in self.pending.values():
+            fut.cancel()
+        self.pending.clear()
+        if self._own_executor:
+            self.executor.shutdown(wait=False)
+
+def play(seed: Optional[int] = None, config: Optional[GameConfig] = None, ansi: bool = False):
+    """Интерактивная партия с фоновой подготовкой уровней (см. bettercode.py --pregen)."""
+    if seed is None:
+        seed = random.SystemRandom().randrange(2**32)
+    config = config if config is not None else GameConfig()
+    levels = LevelFactory(seed, config)
+    try:
+        Game(config=config, rng=random.Random(seed), levels=levels).main_loop(ansi=ansi)
+    finally:
+        levels.close()
+
+if __name__ == "__main__":
+    # замер перехода между уровнями: python levels.py [размер] [уровней]
+    size = int(sys.argv[1]) if len(sys.argv) > 1 else 300
+    count = int(sys.argv[2]) if len(sys.argv) > 2 else 5
+    cfg = GameConfig(size_min=size, size_max=size, compact=True)
+    for mode in ('inline', 'pregen'):
+        levels = LevelFactory(0, cfg) if mode == 'pregen' else None
+        game = Game(out=lambda *a, **k: None, config=cfg, rng=random.Random(0), levels=levels)
+        worst = total = 0.0
+        for lv in range(2, count + 2):
+            time.sleep(0.5)  # «игрок исследует уровень»
+            t0 = time.perf_counter()
+            game.init_new_level(lv)
+            dt = time.perf_counter() - t0
+            worst, total = max(worst, dt), total + dt
+        print(f"{mode}: переход в среднем {total / count * 1000:.1f} мс, худший {worst * 1000:.1f} мс")
+        if levels is not None:
+            levels.close()
@@ -0,0 +1,96 @@
+"""
+Счётчики и гистограммы времени для Game.
+
+Game(hooks=Metrics()) сообщает о шагах, комнатах, отрисовке карты,
+генерации уровней и ходах боя. Без hooks (по умолчанию) игра делает
+только проверку `is not None` в этих местах.
+
+    m = Metrics()
+    game = Game(hooks=m, ...)
+    ...
+    m.dump('metrics.json')
+
+Любой объект с методами event(name) и timing(name, seconds) тоже подойдёт.
+"""
+from __future__ import annotations
+import json
+from collections import Counter
+from typing import Dict, List
+
+class Histogram:
+    """Время по степеням двойки в микросекундах: корзина i — [2^(i-1), 2^i) мкс."""
+    __slots__ = ('count', 'total', 'max', 'buckets')
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.buckets: List[int] = []
+
+    def add(self, seconds: float):
+        self.count += 1
+        self.total += seconds
+        if seconds > self.max:
+            self.max = seconds
+        b = int(seconds * 1e6).bit_length()
+        if b >= len(self.buckets):
+            self.buckets.extend([0] * (b + 1 - len(self.buckets)))
+        self.buckets[b] += 1
+
+    def merge(self, other: 'Histogram'):
+        self.count += other.count
+        self.total += other.total
+        self.max = max(self.max, other.max)
+        if len(other.buckets) > len(self.buckets):
+            self.buckets.extend([0] * (len(other.buckets) - len(self.buckets)))
+        for i, n in enumerate(other.buckets):
+            self.buckets[i] += n
+
+    def percentile(self, p: float) -> float:
+        """Верхняя граница корзины, в которую попал p-й процентиль, мкс."""
+        need = self.count * p / 100
+        seen = 0
+        for i, n in enumerate(self.buckets):
+            seen += n
+            if seen >= need and n:
+                return float(1 << i)
+        return 0.0
+
+    def as_dict(self) -> Dict:
+        return {
+            'count': self.count,
+            'total_ms': round(self.total * 1000, 3),
+            'mean_us': round(self.total / self.count * 1e6, 2) if self.count else 0.0,
+            'max_us': round(self.max * 1e6, 2),
+            'p50_us': self.percentile(50),
+            'p90_us': self.percentile(90),
+            'p99_us': self.percentile(99),
+            'buckets_us': {f'<{1 << i}': n for i, n in enumerate(self.buckets) if n},
+        }
+
+class Metrics:
+    def __init__(self):
+        self.counters: Counter = Counter()
+        self.timings: Dict[str, Histogram] = {}
+
+    def event(self, name: str):
+        self.counters[name] += 1
+
+    def timing(self, name: str, seconds: float):
+        h = self.timings.get(name)
+        if h is None:
+            h = self.timings[name] = Histogram()
+        h.add(seconds)
+
+    def merge(self, other: 'Metrics'):
+        self.counters.update(other.counters)
+        for name, h in other.timings.items():
+            self.timings.setdefault(name, Histogram()).merge(h)
+
+    def as_dict(self) -> Dict:
+        return {'counters': dict(sorted(self.counters.items())),
+                'timings': {name: h.as_dict() for name, h in sorted(self.timings.items())}}
+
+    def dump(self, path: str):
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump(self.as_dict(), f, ensure_ascii=False, indent=2)
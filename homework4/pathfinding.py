@@ -0,0 +1,207 @@
+"""
+Поиск путей по подземелью: BFS-поля расстояний и A* с ценой ловушек/монстров.
+
+Все результаты кэшируются и сбрасываются, когда меняется Dungeon.revision
+(он растёт, когда у комнаты меняется вид).
+
+    pf = PathFinder(game.dungeon)
+    pf.distance((x, y), dungeon.key_pos)  # шагов в обход ловушек и монстров
+    pf.path((x, y), dungeon.portal_pos)   # самый дешёвый путь с учётом урона
+"""
+from __future__ import annotations
+import heapq
+from array import array
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+from bettercode import DIRS, KIND_CODE, CompactGrid, Dungeon
+
+Cell = Tuple[int, int]
+
+AVOID = ('trap', 'monster')  # куда BFS по умолчанию не заходит
+
+class PathFinder:
+    def __init__(self, dungeon: Dungeon, monster_cost: int = 20, trap_weight: int = 1):
+        # цена входа в клетку: 1, ловушка +trap_weight*урон, монстр +monster_cost
+        self.dungeon = dungeon
+        self.monster_cost = monster_cost
+        self.trap_weight = trap_weight
+        self._revision = -1
+        self._kinds = b''
+        self._masks: Dict[frozenset, bytes] = {}
+        self._fields: Dict[Tuple[int, frozenset], array] = {}
+        self._costs: Optional[Dict[int, int]] = None
+
+    # -----------------------------
+    # кэш
+    # -----------------------------
+    def _sync(self):
+        d = self.dungeon
+        if d.revision == self._revision:
+            return
+        self._revision = d.revision
+        if isinstance(d.grid, CompactGrid):
+            self._kinds = bytes(d.grid.kinds)
+        else:
+            self._kinds = bytes(KIND_CODE[r.kind] for row in d.grid for r in row)
+        self._masks.clear()
+        self._fields.clear()
+        self._costs = None
+
+    def _mask(self, avoid: frozenset) -> bytes:
+        # 1 — клетка закрыта для BFS
+        mask = self._masks.get(avoid)
+        if mask is None:
+            codes = {KIND_CODE[k] for k in avoid}
+            mask = self._kinds.translate(bytes(1 if c in codes else 0 for c in range(256)))
+            self._masks[avoid] = mask
+        return mask
+
+    def _extra_costs(self) -> Dict[int, int]:
+        if self._costs is None:
+            d, m = self.dungeon, self.dungeon.m
+            trap, monster = KIND_CODE['trap'], KIND_CODE['monster']
+            costs = {}
+            for c, k in enumerate(self._kinds):
+                if k == trap:
+                    costs[c] = self.trap_weight * d.grid[c // m][c % m].trap_damage
+                elif k == monster:
+                    costs[c] = self.monster_cost
+            self._costs = costs
+        return self._costs
+
+    def _neighbours(self, c: int):
+        n, m = self.dungeon.n, self.dungeon.m
+        x, y = divmod(c, m)
+        if x > 0: yield c - m
+        if x < n - 1: yield c + m
+        if y > 0: yield c - 1
+        if y < m - 1: yield c + 1
+
+    # -----------------------------
+    # BFS
+    # -----------------------------
+    def distances(self, target: Cell, avoid: Iterable[str] = AVOID) -> array:
+        """Поле расстояний до target: dist[x*m + y], -1 — не добраться.
+
+        Клетки вида из avoid не проходятся (сама target — можно).
+        """
+        self._sync()
+        avoid = frozenset(avoid)
+        key = (target[0]*self.dungeon.m + target[1], avoid)
+        dist = self._fields.get(key)
+        if dist is None:
+            dist = self._bfs(key[0], self._mask(avoid))
+            self._fields[key] = dist
+        return dist
+
+    def _bfs(self, start: int, blocked: bytes) -> array:
+        n, m = self.dungeon.n, self.dungeon.m
+        size = n * m
+        dist = array('i', [-1]) * size
+        dist[start] = 0
+        frontier = [start]
+        step = 0
+        while frontier:
+            step += 1
+            nxt = []
+            for c in frontier:
+                y = c % m
+                for nb in (c - m, c + m):
+                    if 0 <= nb < size and dist[nb] < 0 and not blocked[nb]:
+                        dist[nb] = step
+                        nxt.append(nb)
+                if y > 0:
+                    nb = c - 1
+                    if dist[nb] < 0 and not blocked[nb]:
+                        dist[nb] = step
+                        nxt.append(nb)
+                if y < m - 1:
+                    nb = c + 1
+                    if dist[nb] < 0 and not blocked[nb]:
+                        dist[nb] = step
+                        nxt.append(nb)
+            frontier = nxt
+        return dist
+
+    def distance(self, src: Cell, target: Cell, avoid: Iterable[str] = AVOID) -> int:
+        return self.distances(target, avoid)[src[0]*self.dungeon.m + src[1]]
+
+    def next_step(self, src: Cell, target: Cell, avoid: Iterable[str] = AVOID) -> Optional[str]:
+        """Направление (w/a/s/d) первого шага кратчайшего пути, None — пути нет или уже на месте."""
+        dist = self.distances(target, avoid)
+        m = self.dungeon.m
+        best, best_d = None, dist[src[0]*m + src[1]]
+        for key, (dx, dy) in DIRS.items():
+            x, y = src[0] + dx, src[1] + dy
+            if 0 <= x < self.dungeon.n and 0 <= y < m:
+                dd = dist[x*m + y]
+                if 0 <= dd and (best_d < 0 or dd < best_d):
+                    best, best_d = key, dd
+        return best
+
+    def nearest(self, src: Cell, accept: Callable[[int, int], bool],
+                avoid: Iterable[str] = AVOID) -> Optional[Cell]:
+        """Ближайшая от src клетка, для которой accept(x, y) истинно (например, неисследованная)."""
+        self._sync()
+        n, m = self.dungeon.n, self.dungeon.m
+        blocked = self._mask(frozenset(avoid))
+        start = src[0]*m + src[1]
+        seen = bytearray(n * m)
+        seen[start] = 1
+        frontier = [start]
+        while frontier:
+            nxt = []
+            for c in frontier:
+                x, y = divmod(c, m)
+                if c != start and accept(x, y):
+                    return (x, y)
+                for nb in self._neighbours(c):
+                    if not seen[nb] and not blocked[nb]:
+                        seen[nb] = 1
+                        nxt.append(nb)
+            frontier = nxt
+        return None
+
+    # -----------------------------
+    # A*
+    # -----------------------------
+    def path(self, src: Cell, target: Cell) -> Optional[List[Cell]]:
+        """Самый дешёвый путь src → target (без src) с учётом цены ловушек и монстров."""
+        self._sync()
+        m = self.dungeon.m
+        costs = self._extra_costs()
+        start, goal = src[0]*m + src[1], target[0]*m + target[1]
+        tx, ty = target
+
+        def h(c):
+            x, y = divmod(c, m)
+            return abs(x - tx) + abs(y - ty)
+
+        best = {start: 0}
+        came: Dict[int, int] = {}
+        # при равном f берём узел с большим g (-g в куче) — меньше разворачиваем ничьих
+        heap = [(h(start), 0, start)]
+        while heap:
+            _, g, c = heapq.heappop(heap)
+            g = -g
+            if c == goal:
+                cells = []
+                while c != start:
+                    cells.append(divmod(c, m))
+                    c = came[c]
+                return cells[::-1]
+            if g > best[c]:
+                continue
+            for nb in self._neighbours(c):
+                ng = g + 1 + costs.get(nb, 0)
+                if ng < best.get(nb, ng + 1):
+                    best[nb] = ng
+                    came[nb] = c
+                    heapq.heappush(heap, (ng + h(nb), -ng, nb))
+        return None
+
+    def path_cost(self, cells: List[Cell]) -> int:
+        self._sync()
+        m = self.dungeon.m
+        costs = self._extra_costs()
+        return sum(1 + costs.get(x*m + y, 0) for x, y in cells)
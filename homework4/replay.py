@@ -0,0 +1,209 @@
+"""
+Запись и воспроизведение партий.
+
+Запись — JSON lines: заголовок (версия, семя, настройки), по строке на
+каждый ответ игрока (команда, действие в бою, ответ про сундук, рестарт)
+вместе с бросками rng, сделанными до этого ответа, и в конце хэш
+состояния игры. Воспроизведение идёт без терминала, сверяет броски
+после каждого ответа и итоговый хэш.
+
+    python bettercode.py 42 --record=session.log   # играть и записывать
+    python replay.py session.log other.log          # проверить и замерить
+"""
+from __future__ import annotations
+import hashlib
+import json
+import random
+import sys
+import time
+from dataclasses import asdict
+from typing import Dict, List, Optional
+
+from bettercode import ConsolePolicy, Game, GameConfig
+from headless import null_sink
+import savegame
+
+# 2 — предметы в сохранении по значению (хэши состояния прежних записей не сходятся)
+# 3 — номера стопок инвентаря: use N / equip N в старых записях указывают на другие предметы
+# 4 — в сохранении (и хэше состояния) незаконченный вопрос игры
+# 5 — random_cell тянет клетки повторно: при том же seed подземелья другие
+# 6 — в сохранении имя убившего врага отдельно от причины смерти
+LOG_VERSION = 6
+
+class ReplayError(Exception):
+    pass
+
+class _EndOfLog(Exception):
+    pass
+
+class RecordingRandom(random.Random):
+    """random.Random, запоминающий каждый бросок.
+
+    Все методы Random сводятся к random() и getrandbits(), их и перехватываем.
+    """
+
+    def __init__(self, seed=None):
+        self.draws: List = []
+        super().__init__(seed)
+
+    def random(self):
+        x = super().random()
+        self.draws.append(x)
+        return x
+
+    def getrandbits(self, k):
+        x = super().getrandbits(k)
+        self.draws.append(x)
+        return x
+
+    def take(self) -> List:
+        draws, self.draws = self.draws, []
+        return draws
+
+def state_hash(game: Game) -> str:
+    """Хэш полного состояния партии (игрок, подземелье, rng)."""
+    return hashlib.sha256(savegame.dumps(game, compress=False)).hexdigest()
+
+# -----------------------------
+# Запись
+# -----------------------------
+class RecordingPolicy:
+    """Обёртка над policy: пишет каждый ответ и броски rng перед ним."""
+
+    def __init__(self, inner, rng: RecordingRandom, entries: list):
+        self.inner = inner
+        self.rng = rng
+        self.entries = entries
+
+    def _log(self, ctx: str, value):
+        self.entries.append({'ctx': ctx, 'value': value, 'draws': self.rng.take()})
+        return value
+
+    def command(self, game: Game) -> str:
+        return self._log('command', self.inner.command(game))
+
+    def combat_action(self, game: Game, enemy) -> str:
+        return self._log('combat', self.inner.combat_action(game, enemy))
+
+    def use_key_on_chest(self, game: Game, room) -> bool:
+        return self._log('chest', self.inner.use_key_on_chest(game, room))
+
+    def restart(self, game: Game) -> bool:
+        return self._log('restart', self.inner.restart(game))
+
+def write_log(path: str, seed: Optional[int], config: GameConfig, entries: list, game: Optional[Game] = None):
+    with open(path, 'w', encoding='utf-8') as f:
+        f.write(json.dumps({'version': LOG_VERSION, 'seed': seed, 'config': asdict(config)}) + '\n')
+        for e in entries:
+            f.write(json.dumps(e, ensure_ascii=False) + '\n')
+        if game is not None:
+            end = {'end': True, 'draws': game.rng.take(), 'state': state_hash(game)}
+            f.write(json.dumps(end) + '\n')
+
+def record(path: str, seed: Optional[int] = None, config: Optional[GameConfig] = None,
+           policy=None, ansi: bool = False) -> Game:
+    """Интерактивная партия с записью в path (семя обязательно для воспроизведения)."""
+    if seed is None:
+        seed = random.SystemRandom().randrange(2**32)
+    config = config if config is not None else GameConfig()
+    rng = RecordingRandom(seed)
+    entries: list = []
+    pol = RecordingPolicy(policy if policy is not None else ConsolePolicy(), rng, entries)
+    game = None
+    finished = False
+    try:
+        game = Game(policy=pol, config=config, rng=rng)
+        game.main_loop(ansi=ansi)
+        finished = True
+    finally:
+        # прерванная партия тоже пишется, но без итогового хэша
+        write_log(path, seed, config, entries, game if finished else None)
+    return game
+
+# -----------------------------
+# Воспроизведение
+# -----------------------------
+def read_log(path: str) -> Dict:
+    with open(path, encoding='utf-8') as f:
+        header = json.loads(f.readline())
+        if header.get('version') != LOG_VERSION:
+            raise ReplayError(f"Неподдерживаемая версия записи: {header.get('version')}")
+        entries, end = [], None
+        for line in f:
+            e = json.loads(line)
+            if e.get('end'):
+                end = e
+            else:
+                entries.append(e)
+    header['entries'] = entries
+    header['end'] = end
+    return header
+
+class ReplayPolicy:
+    def __init__(self, entries: List[Dict], rng: Optional[RecordingRandom] = None):
+        self.entries = entries
+        self.pos = 0
+        self.rng = rng  # если задан — сверяем броски
+
+    def _next(self, ctx: str):
+        if self.pos >= len(self.entries):
+            raise _EndOfLog()
+        e = self.entries[self.pos]
+        if e['ctx'] != ctx:
+            raise ReplayError(f"Запись {self.pos}: ожидался ответ '{e['ctx']}', игра спрашивает '{ctx}'")
+        if self.rng is not None and self.rng.take() != e['draws']:
+            raise ReplayError(f"Запись {self.pos}: броски rng разошлись")
+        self.pos += 1
+        return e['value']
+
+    def command(self, game: Game) -> str:
+        return self._next('command')
+
+    def combat_action(self, game: Game, enemy) -> str:
+        return self._next('combat')
+
+    def use_key_on_chest(self, game: Game, room) -> bool:
+        return self._next('chest')
+
+    def restart(self, game: Game) -> bool:
+        return self._next('restart')
+
+def replay(session: Dict, check_draws: bool = True) -> Game:
+    """Проигрывает запись без вывода. Бросает ReplayError при расхождении."""
+    seed = session['seed']
+    rng = RecordingRandom(seed) if check_draws else random.Random(seed)
+    pol = ReplayPolicy(session['entries'], rng if check_draws else None)
+    game = Game(policy=pol, out=null_sink, config=GameConfig(**session['config']), rng=rng)
+    try:
+        while game.step(pol.command(game)):
+            pass
+    except _EndOfLog:
+        return game  # запись прервана — сверять итог не с чем
+    end = session['end']
+    if end is not None:
+        if pol.pos != len(session['entries']):
+            raise ReplayError(f"Игра закончилась раньше записи: {pol.pos} из {len(session['entries'])}")
+        if check_draws and rng.take() != end['draws']:
+            raise ReplayError("Броски rng в конце партии разошлись")
+        if state_hash(game) != end['state']:
+            raise ReplayError("Хэш итогового состояния не совпал")
+    return game
+
+if __name__ == "__main__":
+    if len(sys.argv) < 2:
+        print("Использование: python replay.py <запись> [<запись> ...] [--fast]")
+        sys.exit(2)
+    check = '--fast' not in sys.argv[1:]
+    paths = [a for a in sys.argv[1:] if not a.startswith('--')]
+    sessions = [(p, read_log(p)) for p in paths]
+    failed = 0
+    t0 = time.perf_counter()
+    for path, session in sessions:
+        try:
+            replay(session, check_draws=check)
+        except ReplayError as e:
+            failed += 1
+            print(f"{path}: {e}")
+    dt = time.perf_counter() - t0
+    print(f"Записей: {len(sessions)}, ошибок: {failed}, {len(sessions) / dt:.0f} записей/с")
+    sys.exit(1 if failed else 0)
@@ -0,0 +1,307 @@
+"""
+Сохранение и загрузка Game в компактный двоичный формат.
+
+Заголовок: b'DCSV', версия, флаги (бит 0 — тело сжато zlib). Дальше:
+строки (общая таблица), предметы, настройки, игрок, состояние rng,
+подземелье и вопрос, которого ждёт игра (бой, сундук, перезапуск). Сетка пишется массивами целиком (вид uint8, флаги uint8,
+урон ловушек uint16, пул свободных клеток int32), враги и лут — плоскими
+массивами int32, так что сетка CompactGrid загружается чтением нескольких
+срезов, без объекта на каждую комнату.
+
+    data = dumps(game)
+    game2 = loads(data, policy=..., out=...)   # или fork(game)
+    save(game, 'slot1.sav'); game = load('slot1.sav')
+"""
+from __future__ import annotations
+import json
+import random
+import struct
+import sys
+import zlib
+from array import array
+from dataclasses import asdict
+from typing import Dict, List, Optional
+
+from bettercode import (KIND_CODE, KINDS, F_CHEST_LOCKED, F_EXPLORED, F_PORTAL_ENABLED, F_SEEN,
+                        Armor, CompactGrid, Consumable, Dungeon, Enemy, Game, GameConfig, Item,
+                        Player, Room, Weapon, catalog_item)
+
+MAGIC = b'DCSV'
+VERSION = 4  # 2 — инвентарь стопками с номерами, 3 — вопрос Game.prompt и комната, о которой он,
+             # 4 — причина смерти отдельно от имени убившего врага
+F_ZLIB = 1
+
+HEADER = struct.Struct('<4sHH')
+PLAYER = struct.Struct('<11i')
+DUNGEON = struct.Struct('<3i4iBq')
+GAME = struct.Struct('<4i')
+PROMPT = struct.Struct('<4i')  # вопрос, клетка Game._room, клетка и прежний вид Game._entered
+
+PROMPTS = tuple(Game.PROMPTS)
+
+# тип предмета -> (код, имя поля со статом)
+ITEM_TYPES = {Item: (0, None), Weapon: (1, 'atk'), Armor: (2, 'defense'), Consumable: (3, 'heal')}
+ITEM_CLASSES = {code: (cls, stat) for cls, (code, stat) in ITEM_TYPES.items()}
+
+class SaveError(ValueError):
+    pass
+
+def _native(arr: array) -> array:
+    # в файле всё little-endian
+    if sys.byteorder == 'big':
+        arr = array(arr.typecode, arr)
+        arr.byteswap()
+    return arr
+
+# -----------------------------
+# Запись
+# -----------------------------
+class _Writer:
+    def __init__(self):
+        self.parts: List[bytes] = []
+        self.strings: Dict[str, int] = {}
+
+    def pack(self, st: struct.Struct, *values):
+        self.parts.append(st.pack(*values))
+
+    def blob(self, data: bytes):
+        self.parts.append(struct.pack('<I', len(data)))
+        self.parts.append(data)
+
+    def ints(self, values, typecode='i'):
+        self.blob(_native(array(typecode, values)).tobytes())
+
+    def string(self, s: Optional[str]) -> int:
+        if s is None:
+            return -1
+        idx = self.strings.get(s)
+        if idx is None:
+            idx = self.strings[s] = len(self.strings)
+        return idx
+
+class _Items:
+    """Таблица предметов: одинаковый (по значению) предмет пишется один раз."""
+
+    def __init__(self, w: _Writer):
+        self.w = w
+        self.ids: Dict[Item, int] = {}
+        self.rows: List[int] = []
+
+    def id(self, item: Optional[Item]) -> int:
+        if item is None:
+            return -1
+        idx = self.ids.get(item)
+        if idx is None:
+            code, stat = ITEM_TYPES[type(item)]
+            idx = self.ids[item] = len(self.ids)
+            self.rows += [code, getattr(item, stat) if stat else 0,
+                          self.w.string(item.name), self.w.string(item.desc)]
+        return idx
+
+def _grid_arrays(d: Dungeon):
+    g = d.grid
+    if isinstance(g, CompactGrid):
+        return bytes(g.kinds), bytes(g.flags), g.trap, g.enemies, g.loot
+    kinds, flags, trap = bytearray(), bytearray(), array('H')
+    enemies, loot = {}, {}
+    for idx, r in enumerate(r for row in g for r in row):
+        kinds.append(KIND_CODE[r.kind])
+        flags.append((F_SEEN if r.seen else 0) | (F_EXPLORED if r.explored else 0)
+                     | (F_CHEST_LOCKED if r.chest_locked else 0)
+                     | (F_PORTAL_ENABLED if r.portal_enabled else 0))
+        trap.append(r.trap_damage)
+        if r.enemy is not None:
+            enemies[idx] = r.enemy
+        if r.chest_contents:
+            loot[idx] = r.chest_contents
+    return bytes(kinds), bytes(flags), trap, enemies, loot
+
+def dumps(game: Game, compress: bool = True) -> bytes:
+    w = _Writer()
+    items = _Items(w)
+    body = _Writer()
+    body.strings = w.strings  # одна таблица строк на всё сохранение
+
+    # игра и настройки
+    body.pack(GAME, game.level, game.turns, w.string(game.death_cause), w.string(game.death_enemy))
+    body.blob(json.dumps(asdict(game.config)).encode())
+    # rng
+    version, state, gauss = game.rng.getstate()
+    body.ints(state, 'I')
+    body.blob(b'' if gauss is None else struct.pack('<d', gauss))
+
+    # игрок
+    p = game.player
+    body.pack(PLAYER, p.x, p.y, p.hp_max, p.hp, p.atk_base, p.def_base, p.keys, p.level, p.exp,
+              items.id(p.weapon), items.id(p.armor))
+    inv = [p.inventory.next_id]
+    for sid, it, count in p.inventory.stacks():
+        inv += [sid, items.id(it), count]
+    body.ints(inv)
+
+    # подземелье
+    d = game.dungeon
+    kinds, flags, trap, enemies, loot = _grid_arrays(d)
+    body.pack(DUNGEON, d.n, d.m, d.difficulty, *d.portal_pos, *d.key_pos, d.compact,
+              -1 if d.seed is None else d.seed)
+    body.blob(kinds)
+    body.blob(flags)
+    body.blob(_native(array('H', trap)).tobytes())
+    erows = []
+    for idx, e in enemies.items():
+        erows += [idx, e.hp, e.atk, e.defense, e.exp, w.string(e.name)]
+    body.ints(erows)
+    lrows = []
+    for idx, contents in loot.items():
+        for it in contents:
+            lrows += [idx, items.id(it)]
+    body.ints(lrows)
+    body.blob(_native(d.free.cells).tobytes())
+    body.blob(_native(d.free.pos).tobytes())
+
+    # незаконченный вопрос: бой и сундук — про комнату, в которую вошли (см. Game._cmd_move)
+    entered, kind = -1, 0
+    if game._entered is not None and game._entered[0] is d:
+        _, x, y, was = game._entered
+        entered, kind = x*d.m + y, KIND_CODE[was]
+    body.pack(PROMPT, PROMPTS.index(game.prompt), entered if game._room is not None else -1, entered, kind)
+
+    # таблицы строк и предметов идут перед телом — они нужны при чтении
+    strings = sorted(w.strings, key=w.strings.get)
+    w.blob(json.dumps(strings, ensure_ascii=False).encode())
+    w.ints(items.rows)
+    raw = b''.join(w.parts + body.parts)
+    flags_ = 0
+    if compress:
+        raw = zlib.compress(raw, 1)
+        flags_ |= F_ZLIB
+    return HEADER.pack(MAGIC, VERSION, flags_) + raw
+
+# -----------------------------
+# Чтение
+# -----------------------------
+class _Reader:
+    def __init__(self, data: bytes):
+        self.buf = memoryview(data)
+        self.pos = 0
+
+    def unpack(self, st: struct.Struct):
+        values = st.unpack_from(self.buf, self.pos)
+        self.pos += st.size
+        return values
+
+    def blob(self) -> memoryview:
+        (size,) = struct.unpack_from('<I', self.buf, self.pos)
+        self.pos += 4
+        data = self.buf[self.pos:self.pos + size]
+        if len(data) != size:
+            raise SaveError("Сохранение обрезано.")
+        self.pos += size
+        return data
+
+    def ints(self, typecode='i') -> array:
+        arr = array(typecode)
+        arr.frombytes(self.blob())
+        return _native(arr)
+
+def loads(data: bytes, policy=None, out=None, compact: Optional[bool] = None) -> Game:
+    """Восстанавливает Game. compact — переопределить вид сетки (по умолчанию как при сохранении)."""
+    if len(data) < HEADER.size:
+        raise SaveError("Это не сохранение игры.")
+    magic, version, flags_ = HEADER.unpack_from(data)
+    if magic != MAGIC:
+        raise SaveError("Это не сохранение игры.")
+    if version != VERSION:
+        raise SaveError(f"Неподдерживаемая версия сохранения: {version}.")
+    raw = data[HEADER.size:]
+    if flags_ & F_ZLIB:
+        raw = zlib.decompress(raw)
+    r = _Reader(raw)
+
+    strings = json.loads(bytes(r.blob()))
+    string = lambda i: None if i < 0 else strings[i]
+    rows = r.ints()
+    items: List[Item] = []
+    for k in range(0, len(rows), 4):
+        code, stat_value, name, desc = rows[k:k + 4]
+        cls, _ = ITEM_CLASSES[code]
+        items.append(catalog_item(cls, strings[name], strings[desc], stat_value))
+    item = lambda i: None if i < 0 else items[i]
+
+    level, turns, cause, enemy = r.unpack(GAME)
+    config = GameConfig(**json.loads(bytes(r.blob())))
+    state = tuple(r.ints('I'))
+    gauss = r.blob()
+    rng = random.Random()
+    rng.setstate((3, state, struct.unpack('<d', gauss)[0] if gauss else None))
+
+    game = Game(policy=policy, out=out, config=config, rng=rng, new_level=False)
+    game.level, game.turns, game.death_cause = level, turns, string(cause)
+    game.death_enemy = string(enemy)
+
+    x, y, hp_max, hp, atk_base, def_base, keys, plevel, exp, weapon, armor = r.unpack(PLAYER)
+    game.player = Player(x=x, y=y, hp_max=hp_max, hp=hp, atk_base=atk_base, def_base=def_base,
+                         weapon=item(weapon), armor=item(armor), keys=keys, level=plevel, exp=exp)
+    inv = r.ints()
+    for k in range(1, len(inv), 3):
+        game.player.inventory.put(inv[k], items[inv[k + 1]], inv[k + 2])
+    game.player.inventory.next_id = inv[0]
+
+    n, m, difficulty, px, py, kx, ky, was_compact, seed = r.unpack(DUNGEON)
+    if compact is None:
+        compact = bool(was_compact)
+    d = Dungeon(n=n, m=m, seed=None if seed < 0 else seed, difficulty=difficulty, rng=rng,
+                compact=compact, generate=False)
+    d.portal_pos, d.key_pos = (px, py), (kx, ky)
+    kinds, flags = r.blob(), r.blob()
+    trap = r.ints('H')
+    erows, lrows = r.ints(), r.ints()
+    enemies = {erows[k]: Enemy(name=strings[erows[k + 5]], hp=erows[k + 1], atk=erows[k + 2],
+                               defense=erows[k + 3], exp=erows[k + 4])
+               for k in range(0, len(erows), 6)}
+    loot: Dict[int, List[Item]] = {}
+    for k in range(0, len(lrows), 2):
+        loot.setdefault(lrows[k], []).append(items[lrows[k + 1]])
+
+    if compact:
+        g = d.grid
+        g.kinds, g.flags, g.trap = bytearray(kinds), bytearray(flags), trap
+        g.enemies, g.loot = enemies, loot
+    else:
+        for i in range(n):
+            row = d.grid[i]
+            for j in range(m):
+                idx = i*m + j
+                f = flags[idx]
+                row[j] = Room(kind=KINDS[kinds[idx]], seen=bool(f & F_SEEN), explored=bool(f & F_EXPLORED),
+                              chest_locked=bool(f & F_CHEST_LOCKED), chest_contents=loot.get(idx, []),
+                              enemy=enemies.get(idx), trap_damage=trap[idx],
+                              portal_enabled=bool(f & F_PORTAL_ENABLED))
+    d.free.cells = r.ints()
+    d.free.pos = r.ints()
+    game.dungeon = d
+
+    prompt, room, entered, kind = r.unpack(PROMPT)
+    game.prompt = PROMPTS[prompt]
+    if room >= 0:
+        game._room = d.grid[room // m][room % m]
+    if entered >= 0:
+        game._entered = (d, entered // m, entered % m, KINDS[kind])
+    return game
+
+# -----------------------------
+# Файлы и развилки
+# -----------------------------
+def save(game: Game, path: str, compress: bool = True):
+    with open(path, 'wb') as f:
+        f.write(dumps(game, compress=compress))
+
+def load(path: str, policy=None, out=None, compact: Optional[bool] = None) -> Game:
+    with open(path, 'rb') as f:
+        return loads(f.read(), policy=policy, out=out, compact=compact)
+
+def fork(game: Game, policy=None, out=None) -> Game:
+    """Независимая копия партии с той же позиции (и тем же состоянием rng)."""
+    return loads(dumps(game, compress=False),
+                 policy=policy if policy is not None else game.policy,
+                 out=out if out is not None else game.out)
@@ -0,0 +1,199 @@
+"""
+Сервер игры на asyncio: тысячи партий в одном цикле событий.
+
+Протокол строковый (UTF-8). Сервер шлёт вывод игры, затем строку
+'?<вопрос>' — command, combat, chest или restart — и ждёт одну строку
+ответа. Конец партии — строка '!bye'. Партия не блокирует цикл: каждый
+ответ — один вызов Game.feed.
+
+    python server.py serve --port 7777            # или --unix /tmp/dungeon.sock
+    python server.py load --clients 2000 --turns 100 --port 7777
+    python server.py load --clients 2000 --spawn  # сервер в том же процессе
+
+Тысячи соединений требуют достаточного лимита файлов (ulimit -n).
+"""
+from __future__ import annotations
+import argparse
+import asyncio
+import itertools
+import random
+import sys
+import time
+from typing import List, Optional
+
+from bettercode import DIRS, Game, GameConfig
+
+BYE = '!bye'
+
+class _Buffer:
+    """out для Game: копит вывод до отправки клиенту."""
+
+    def __init__(self):
+        self.parts: List[str] = []
+
+    def __call__(self, *args, sep=' ', end='\n', flush=False):
+        self.parts.append(sep.join(map(str, args)) + end)
+
+    def drain(self) -> str:
+        text = ''.join(self.parts)
+        self.parts.clear()
+        return text
+
+class GameServer:
+    def __init__(self, config: Optional[GameConfig] = None, seed: int = 0, show_map: bool = True):
+        # seed — семя первой партии, дальше по порядку подключения
+        self.config = config if config is not None else GameConfig()
+        self.show_map = show_map
+        self._seeds = itertools.count(seed)
+        self.sessions = 0   # активных сейчас
+        self.finished = 0
+        # время Game.feed на сервере, с; None — не копить (в serve читать их некому),
+        # список заводит load_test
+        self.step_times: Optional[List[float]] = None
+
+    async def start(self, host='127.0.0.1', port=7777, unix: Optional[str] = None):
+        if unix:
+            return await asyncio.start_unix_server(self.handle, path=unix, backlog=4096)
+        return await asyncio.start_server(self.handle, host, port, backlog=4096)
+
+    async def handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        buf = _Buffer()
+        seed = next(self._seeds)
+        game = Game(out=buf, config=self.config, rng=random.Random(seed))
+        buf(f"Добро пожаловать в Dungeon Crawler! Партия {seed}.")
+        self.sessions += 1
+        running = True
+        try:
+            while running:
+                if game.prompt == 'command':
+                    game.show_status()
+                    if self.show_map:
+                        game.render_map()
+                writer.write((buf.drain() + f'?{game.prompt}\n').encode())
+                await writer.drain()
+                line = await reader.readline()
+                if not line:
+                    break
+                t0 = time.perf_counter()
+                running = game.feed(line.decode().rstrip('\r\n'))
+                if self.step_times is not None:
+                    self.step_times.append(time.perf_counter() - t0)
+            if not running:
+                writer.write((buf.drain() + BYE + '\n').encode())
+                await writer.drain()
+                self.finished += 1
+        except OSError:
+            pass  # клиент оборвал соединение
+        finally:
+            self.sessions -= 1
+            writer.close()
+
+# -----------------------------
+# Нагрузка
+# -----------------------------
+def _answer(prompt: str, rng: random.Random, done: bool) -> str:
+    if prompt == 'command':
+        return 'q' if done else rng.choice(tuple(DIRS))
+    if prompt == 'combat':
+        return 'hit'
+    if prompt == 'chest':
+        return 'y'
+    return '2' if done else '1'
+
+async def client(seed: int, turns: int, latencies: List[float], host='127.0.0.1', port=7777,
+                 unix: Optional[str] = None):
+    """Простой клиент: ходит случайно, в бою бьёт, после turns ходов выходит."""
+    if unix:
+        reader, writer = await asyncio.open_unix_connection(unix)
+    else:
+        reader, writer = await asyncio.open_connection(host, port)
+    rng = random.Random(seed)
+    made = 0
+    sent = None
+    try:
+        while True:
+            line = await reader.readline()
+            if not line or line.startswith(BYE.encode()):
+                break
+            if not line.startswith(b'?'):
+                continue
+            if sent is not None:
+                latencies.append(time.perf_counter() - sent)
+            prompt = line[1:].strip().decode()
+            if prompt == 'command':
+                made += 1
+            writer.write((_answer(prompt, rng, made > turns) + '\n').encode())
+            sent = time.perf_counter()
+            await writer.drain()
+    finally:
+        writer.close()
+
+def percentiles(values: List[float], ps=(50, 90, 99)) -> dict:
+    if not values:
+        return {}
+    values = sorted(values)
+    res = {f'p{p}': values[min(len(values) - 1, len(values) * p // 100)] for p in ps}
+    res['max'] = values[-1]
+    return res
+
+async def load_test(clients: int, turns: int, seed: int = 0, host='127.0.0.1', port=7777,
+                    unix: Optional[str] = None, server: Optional[GameServer] = None) -> dict:
+    latencies: List[float] = []
+    srv = None
+    if server is not None:
+        server.step_times = []
+        srv = await server.start(host, port, unix)
+    try:
+        t0 = time.perf_counter()
+        results = await asyncio.gather(*(client(seed + i, turns, latencies, host, port, unix)
+                                         for i in range(clients)), return_exceptions=True)
+        dt = time.perf_counter() - t0
+        errors = sum(isinstance(r, BaseException) for r in results)
+    finally:
+        if srv is not None:
+            while server.sessions:  # дать серверу закрыть оставшиеся партии
+                await asyncio.sleep(0.01)
+            srv.close()
+            await srv.wait_closed()
+    report = {'clients': clients, 'errors': errors, 'answers': len(latencies), 'seconds': dt,
+              'answers_per_s': len(latencies) / dt,
+              'latency_ms': {k: v * 1000 for k, v in percentiles(latencies).items()}}
+    if server is not None:
+        report['server_step_ms'] = {k: v * 1000 for k, v in percentiles(server.step_times).items()}
+    return report
+
+async def serve(server: GameServer, host, port, unix):
+    srv = await server.start(host, port, unix)
+    where = unix or f'{host}:{port}'
+    print(f"Сервер слушает {where}", file=sys.stderr)
+    async with srv:
+        await srv.serve_forever()
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser(description="Сервер Dungeon Crawler и нагрузочный клиент")
+    ap.add_argument('mode', choices=['serve', 'load'])
+    ap.add_argument('--host', default='127.0.0.1')
+    ap.add_argument('--port', type=int, default=7777)
+    ap.add_argument('--unix', help='путь Unix-сокета вместо TCP')
+    ap.add_argument('--seed', type=int, default=0)
+    ap.add_argument('--no-map', action='store_true', help='не слать карту перед каждым ходом')
+    ap.add_argument('--clients', type=int, default=1000)
+    ap.add_argument('--turns', type=int, default=100, help='ходов на клиента')
+    ap.add_argument('--spawn', action='store_true', help='load: поднять сервер в этом же процессе')
+    args = ap.parse_args()
+
+    server = GameServer(seed=args.seed, show_map=not args.no_map)
+    if args.mode == 'serve':
+        try:
+            asyncio.run(serve(server, args.host, args.port, args.unix))
+        except KeyboardInterrupt:
+            pass
+    else:
+        report = asyncio.run(load_test(args.clients, args.turns, seed=args.seed, host=args.host,
+                                       port=args.port, unix=args.unix,
+                                       server=server if args.spawn else None))
+        print(f"Клиентов: {report['clients']} (ошибок: {report['errors']}), ответов: {report['answers']}, "
+              f"{report['seconds']:.2f} c ({report['answers_per_s']:.0f} ответов/с)")
+        for name in ('latency_ms', 'server_step_ms'):
+            if name in report:
+                print(name + ': ' + ', '.join(f'{k}={v:.2f}' for k, v in report[name].items()))
@@ -0,0 +1,118 @@
+"""
+Ночной прогон баланса: сетка настроек × семена, раскиданные по процессам.
+
+    python sweep.py --games 2000 --difficulty 1 2 3 --size 5-8 10-12 --hp 80 100
+
+Каждая партия получает свой random.Random(seed), поэтому результат
+для семени не зависит от числа процессов и нарезки.
+"""
+from __future__ import annotations
+import argparse
+import csv
+import itertools
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from bettercode import GameConfig
+from headless import BatchStats, BotPolicy, play_game
+
+Task = Tuple[GameConfig, int, int, int]  # (настройки, первое семя, сколько партий, max_turns)
+
+def run_shard(task: Task) -> Tuple[GameConfig, BatchStats]:
+    cfg, start, count, max_turns = task
+    stats = BatchStats()
+    for s in range(start, start + count):
+        stats.add(play_game(s, BotPolicy(s), max_turns=max_turns, config=cfg))
+    return cfg, stats
+
+def make_tasks(configs: Iterable[GameConfig], games: int, seed: int = 0,
+               chunk: int = 250, max_turns: int = 2000) -> List[Task]:
+    tasks = []
+    for cfg in configs:
+        for start in range(seed, seed + games, chunk):
+            tasks.append((cfg, start, min(chunk, seed + games - start), max_turns))
+    return tasks
+
+def sweep(configs: Iterable[GameConfig], games: int, seed: int = 0, workers: Optional[int] = None,
+          chunk: int = 250, max_turns: int = 2000) -> Dict[GameConfig, BatchStats]:
+    """Играет games партий на каждую настройку и сливает результаты процессов."""
+    configs = list(configs)
+    tasks = make_tasks(configs, games, seed=seed, chunk=chunk, max_turns=max_turns)
+    merged = {cfg: BatchStats() for cfg in configs}
+    if workers == 1:
+        # без пула — удобно для профилирования
+        for cfg, stats in map(run_shard, tasks):
+            merged[cfg].merge(stats)
+        return merged
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        for cfg, stats in pool.map(run_shard, tasks):
+            merged[cfg].merge(stats)
+    return merged
+
+def config_grid(difficulties, sizes, hps, atks, defenses) -> List[GameConfig]:
+    return [GameConfig(size_min=lo, size_max=hi, difficulty=d, hp=hp, atk=atk, defense=df)
+            for d, (lo, hi), hp, atk, df in itertools.product(difficulties, sizes, hps, atks, defenses)]
+
+COLUMNS = ['difficulty', 'size', 'hp', 'atk', 'def', 'games', 'mean_depth', 'max_depth', 'mean_turns',
+           'trap_deaths', 'combat_deaths', 'timeouts']
+
+def table_rows(merged: Dict[GameConfig, BatchStats]) -> List[Dict]:
+    rows = []
+    for cfg, st in merged.items():
+        d = st.as_dict()
+        traps = st.causes.get('trap', 0)
+        timeouts = st.causes.get('timeout', 0)
+        rows.append({
+            'difficulty': cfg.difficulty,
+            'size': f'{cfg.size_min}-{cfg.size_max}',
+            'hp': cfg.hp,
+            'atk': cfg.atk,
+            'def': cfg.defense,
+            'games': d['games'],
+            'mean_depth': d['mean_depth'],
+            'max_depth': d['max_depth'],
+            'mean_turns': d['mean_turns'],
+            'trap_deaths': traps,
+            'combat_deaths': st.causes.get('combat', 0),
+            'timeouts': timeouts,
+        })
+    return rows
+
+def parse_size(s: str) -> Tuple[int, int]:
+    lo, _, hi = s.partition('-')
+    return int(lo), int(hi or lo)
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser(description="Прогон баланса по сетке настроек")
+    ap.add_argument('--games', type=int, default=1000, help='партий на одну настройку')
+    ap.add_argument('--seed', type=int, default=0)
+    ap.add_argument('--difficulty', type=int, nargs='+', default=[1])
+    ap.add_argument('--size', type=parse_size, nargs='+', default=[(5, 8)], help='например 5-8 или 20')
+    ap.add_argument('--hp', type=int, nargs='+', default=[100])
+    ap.add_argument('--atk', type=int, nargs='+', default=[2])
+    ap.add_argument('--defense', type=int, nargs='+', default=[0])
+    ap.add_argument('--workers', type=int, default=os.cpu_count())
+    ap.add_argument('--chunk', type=int, default=250)
+    ap.add_argument('--max-turns', type=int, default=2000)
+    ap.add_argument('--csv', help='куда сохранить таблицу')
+    args = ap.parse_args()
+
+    configs = config_grid(args.difficulty, args.size, args.hp, args.atk, args.defense)
+    t0 = time.perf_counter()
+    merged = sweep(configs, args.games, seed=args.seed, workers=args.workers,
+                   chunk=args.chunk, max_turns=args.max_turns)
+    dt = time.perf_counter() - t0
+    rows = table_rows(merged)
+
+    out = open(args.csv, 'w', newline='') if args.csv else sys.stdout
+    writer = csv.DictWriter(out, fieldnames=COLUMNS)
+    writer.writeheader()
+    writer.writerows(rows)
+    if args.csv:
+        out.close()
+    total = args.games * len(configs)
+    print(f"Партий: {total}, процессов: {args.workers}, время: {dt:.2f} c ({total / dt * 60:.0f} партий/мин)",
+          file=sys.stderr)
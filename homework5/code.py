@@ -1,87 +1,596 @@
+import argparse
+import copy
+import functools
+import glob
+import hashlib
+import json
+import os
+import shutil
+from concurrent.futures import ProcessPoolExecutor
 import pandas as pd
 import numpy as np
 import sys
 
 CSV_PATH = "tested.csv"
 
-def load_data(path):
-    return pd.read_csv(path)
+# -----------------------------
+# Кэш разобранного CSV: каталог <файл>.cache рядом с CSV, по файлу
+# .npy на столбец (числа — как есть и открываются через mmap, строки —
+# коды, а их значения — в отдельном .json рядом) и meta.json со схемой,
+# размером, mtime и хэшем CSV. Читаются только файлы нужных столбцов.
+# -----------------------------
+CACHE_VERSION = 2
 
-def analyze_missing(df):
-    return int(df.isnull().sum().sum())
+def cache_dir(path):
+    return path + '.cache'
 
-def print_column_info(df):
-    print(df.dtypes)
+def file_hash(path):
+    h = hashlib.blake2b(digest_size=16)
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            h.update(block)
+    return h.hexdigest()
 
-def show_head(df, n):
-    print(df.head(n))
+def _cache_meta(path):
+    try:
+        with open(os.path.join(cache_dir(path), 'meta.json'), encoding='utf-8') as f:
+            meta = json.load(f)
+    except (OSError, ValueError):
+        return None
+    st = os.stat(path)
+    if meta.get('version') != CACHE_VERSION or meta['size'] != st.st_size:
+        return None
+    if meta['mtime_ns'] != st.st_mtime_ns:
+        # файл трогали (touch, копирование) — сверяем содержимое
+        if meta['hash'] != file_hash(path):
+            return None
+        meta['mtime_ns'] = st.st_mtime_ns
+        try:
+            with open(os.path.join(cache_dir(path), 'meta.json'), 'w', encoding='utf-8') as f:
+                json.dump(meta, f, ensure_ascii=False)
+        except OSError:
+            pass  # кэш только для чтения — в следующий раз снова сверим хэш
+    return meta
 
-def describe_numeric(df):
-    print(df.describe())
+def read_cache(path, columns=None, dtype=None):
+    """DataFrame из кэша (только columns, если заданы) или None, если кэш устарел.
 
-def print_shape(df):
-    print(df.shape)
+    dtype — как у read_csv; {'Sex': 'category'} берёт коды из кэша как есть.
+    """
+    meta = _cache_meta(path)
+    if meta is None:
+        return None
+    info = {c['name']: c for c in meta['columns']}
+    if columns is None:
+        columns = list(info)
+    else:
+        # столбцов, которых нет в файле, нет и в кэше — их просто пропускаем, как read_csv
+        columns = [name for name in info if name in columns]  # порядок как в файле
+    dtype = dtype or {}
+    data = {}
+    for name in columns:
+        c = info[name]
+        arr = np.load(os.path.join(cache_dir(path), c['file']), mmap_mode='r')
+        if 'values' in c:
+            with open(os.path.join(cache_dir(path), c['values']), encoding='utf-8') as f:
+                categories = json.load(f)
+            values = pd.Categorical.from_codes(np.asarray(arr), categories=categories)
+            want = dtype.get(name, c['dtype'])
+            if want == 'category':
+                # в кэше значения по порядку появления, read_csv(dtype='category') их сортирует
+                data[name] = values.set_categories(pd.Index(categories).sort_values())
+            else:
+                data[name] = pd.Series(values).astype(want)
+        elif name in dtype:
+            data[name] = pd.Series(arr).astype(dtype[name])
+        else:
+            data[name] = arr
+    return pd.DataFrame(data, columns=columns, copy=False)
 
-def compute_survival_stats(df):
-    required = {"Survived", "Age"}
-    if not required.issubset(df.columns):
-        print("Не хватает столбцов для анализа.")
-        return
+def write_cache(path, df):
+    meta = {'version': CACHE_VERSION, 'columns': []}
+    st = os.stat(path)
+    meta.update(size=st.st_size, mtime_ns=st.st_mtime_ns, hash=file_hash(path))
+    target = cache_dir(path)
+    tmp = target + f'.tmp{os.getpid()}'
+    os.makedirs(tmp, exist_ok=True)
+    try:
+        for i, name in enumerate(df.columns):
+            col = df[name]
+            entry = {'name': name, 'file': f'{i}.npy', 'dtype': str(col.dtype)}
+            if col.dtype.kind in 'biuf':
+                arr = col.to_numpy()
+            else:
+                # factorize по хэшу и без сортировки: на уникальных строках
+                # astype('category') или sort=True в разы дольше самого read_csv
+                codes, uniques = pd.factorize(col)
+                arr = codes.astype(np.int32 if len(uniques) < 2**31 else np.int64)
+                entry['values'] = f'{i}.json'
+                with open(os.path.join(tmp, entry['values']), 'w', encoding='utf-8') as f:
+                    json.dump(uniques.tolist(), f, ensure_ascii=False)
+            np.save(os.path.join(tmp, entry['file']), arr)
+            meta['columns'].append(entry)
+        with open(os.path.join(tmp, 'meta.json'), 'w', encoding='utf-8') as f:
+            json.dump(meta, f, ensure_ascii=False)
+        shutil.rmtree(target, ignore_errors=True)
+        os.replace(tmp, target)
+    finally:
+        shutil.rmtree(tmp, ignore_errors=True)
 
-    value_counts = df['Survived'].value_counts(normalize=True)
-    survived_pct = value_counts.get(1, 0) * 100
-    print(f"Процент выживших: {survived_pct:.2f}%")
+def _usecols(columns):
+    # usecols списком падает, если столбца нет в файле; так отчёт его просто не найдёт
+    return None if columns is None else (lambda c: c in columns)
+
+def load_data(path, columns=None, cache=True, dtype=None):
+    # columns — какие столбцы нужны (порядок как в файле), dtype — как у read_csv
+    if cache:
+        df = read_cache(path, columns, dtype)
+        if df is not None:
+            return df
+    elif columns is not None or dtype:
+        return pd.read_csv(path, usecols=_usecols(columns), dtype=dtype)
+    df = pd.read_csv(path)
+    if cache:
+        # кэш всегда полный и с исходными типами
+        try:
+            write_cache(path, df)
+        except OSError:
+            pass  # каталог только для чтения — работаем без кэша
+    if columns is not None:
+        df = df[[c for c in df.columns if c in columns]]
+    return df.astype(dtype) if dtype else df
+
+# -----------------------------
+# Загрузка под нужные отчёты: только их столбцы и компактные типы
+# -----------------------------
+# 'integer' — наименьший целый тип, в который влезают значения (если нет пропусков)
+SCHEMA = {
+    'Survived': 'integer',
+    'Pclass': 'integer',
+    'SibSp': 'integer',
+    'Parch': 'integer',
+    'Sex': 'category',
+    'Embarked': 'category',
+}
+
+# отчёт -> нужные ему столбцы (None — все)
+REPORTS = {
+    'overview': None,
+    'survival': {"Survived", "Age"},
+    'summary': {"Sex", "Pclass", "Age", "Fare", "Survived"},
+}
+
+def required_columns(reports):
+    columns = set()
+    for name in reports:
+        if REPORTS[name] is None:
+            return None
+        columns |= REPORTS[name]
+    return columns
+
+def _object_bytes(col):
+    # сколько занял бы категориальный столбец как обычный object
+    codes = col.cat.codes.to_numpy()
+    counts = np.bincount(codes[codes >= 0], minlength=len(col.cat.categories))
+    sizes = np.array([sys.getsizeof(v) for v in col.cat.categories], dtype=np.int64)
+    return len(col) * 8 + int(counts @ sizes) + int(np.count_nonzero(codes < 0)) * sys.getsizeof(np.nan)
+
+def load_optimized(path, reports=tuple(REPORTS), cache=True):
+    """Столбцы только для reports, типы по SCHEMA.
 
-    overall_avg_age = df['Age'].mean()
-    avg_age_survived = df[df['Survived'] == 1]['Age'].mean()
-    avg_age_died = df[df['Survived'] == 0]['Age'].mean()
+    Возвращает (df, память при обычных типах, память после), в байтах.
+    """
+    columns = required_columns(reports)
+    cats = {c: 'category' for c, kind in SCHEMA.items()
+            if kind == 'category' and (columns is None or c in columns)}
+    df = load_data(path, columns, cache=cache, dtype=cats)
+    before = after = 0
+    for name in df.columns:
+        col = df[name]
+        if isinstance(col.dtype, pd.CategoricalDtype):
+            before += _object_bytes(col)
+        else:
+            before += int(col.memory_usage(deep=True, index=False))
+        if (SCHEMA.get(name) == 'integer' and col.dtype.kind in 'iuf'
+                and not col.isna().any() and (col % 1 == 0).all()):
+            df[name] = pd.to_numeric(col, downcast='integer')
+        after += int(df[name].memory_usage(deep=True, index=False))
+    return df, before, after
 
+def print_memory_report(df, before, after):
+    print(f"Загружено столбцов: {df.shape[1]}, память: {before / 2**20:.2f} МБ -> {after / 2**20:.2f} МБ "
+          f"(в {before / max(after, 1):.1f} раза меньше)")
+
+def _mean(total, count):
+    return total / count if count else float('nan')
+
+def print_survival_stats(survived_pct, overall_avg_age, avg_age_survived, avg_age_died):
+    print(f"Процент выживших: {survived_pct:.2f}%")
     print(f"Средний возраст (всего): {overall_avg_age:.2f}")
     print(f"Средний возраст выживших: {avg_age_survived:.2f}")
     print(f"Средний возраст умерших: {avg_age_died:.2f}")
 
-def create_summary_table(df):
-    needed = {"Sex", "Pclass", "Age", "Fare", "Survived"}
-    if not needed.issubset(df.columns):
-        return None
-
-    cleaned = df.dropna(subset=list(needed))
+def survival_sums(df, masks):
+    # masks: столбец -> маска непустых значений (numpy bool)
+    survived = df['Survived'].to_numpy(dtype=float)
+    age = df['Age'].to_numpy(dtype=float)
+    age_ok = masks['Age']
+    alive = survived == 1
+    ages = {}
+    for key, mask in ((None, age_ok), (1, age_ok & alive), (0, age_ok & (survived == 0))):
+        ages[key] = [float(age[mask].sum()), int(np.count_nonzero(mask))]
+    return int(np.count_nonzero(masks['Survived'])), int(np.count_nonzero(alive)), ages
 
-    grouped = cleaned.groupby(['Sex', 'Pclass'], as_index=False).agg(
-        mean_age=('Age', 'mean'),
-        mean_fare=('Fare', 'mean'),
-        survived_pct=('Survived', lambda x: x.mean() * 100)
-    )
+SUMMARY_COLUMNS = REPORTS['summary']
 
-    grouped['mean_age'] = grouped['mean_age'].round(2)
-    grouped['mean_fare'] = grouped['mean_fare'].round(2)
-    grouped['survived_pct'] = grouped['survived_pct'].round(2)
+def group_sums(df, masks):
+    """(Sex, Pclass) -> [строк, сумма Age, сумма Fare, сумма Survived] по строкам без пропусков."""
+    ok = np.logical_and.reduce([masks[c] for c in SUMMARY_COLUMNS])
+    sex_codes, sexes = pd.factorize(df['Sex'][ok])
+    cls_codes, classes = pd.factorize(df['Pclass'][ok])
+    codes = sex_codes * len(classes) + cls_codes
+    size = len(sexes) * len(classes)
+    counts = np.bincount(codes, minlength=size)
+    sums = [np.bincount(codes, weights=df[c].to_numpy(dtype=float)[ok], minlength=size)
+            for c in ('Age', 'Fare', 'Survived')]
+    sexes, classes = sexes.tolist(), classes.tolist()
+    groups = {}
+    for k in np.flatnonzero(counts):
+        i, j = divmod(int(k), len(classes))
+        groups[(sexes[i], classes[j])] = [int(counts[k])] + [float(col[k]) for col in sums]
+    return groups
 
-    return grouped.rename(columns={
-        'mean_age': 'Mean age',
-        'mean_fare': 'Mean fare',
-        'survived_pct': 'Survived (%)'
+def summary_from_groups(groups, sex_dtype, pclass_dtype):
+    keys = sorted(groups)
+    sums = np.array([groups[k] for k in keys], dtype=float).reshape(-1, 4)
+    grouped = pd.DataFrame({
+        'Sex': pd.Series([k[0] for k in keys], dtype=sex_dtype),
+        'Pclass': pd.Series([k[1] for k in keys], dtype=pclass_dtype),
+        'Mean age': sums[:, 1] / sums[:, 0],
+        'Mean fare': sums[:, 2] / sums[:, 0],
+        'Survived (%)': sums[:, 3] / sums[:, 0] * 100,
     })
+    for col in ('Mean age', 'Mean fare', 'Survived (%)'):
+        grouped[col] = grouped[col].round(2)
+    return grouped
+
+# -----------------------------
+# Агрегаты отчёта: все метрики считаются за один проход по столбцам
+# (PartialStats.from_chunk) и печатаются из результата. В потоковом
+# режиме файл читается кусками по chunksize строк, агрегаты кусков
+# сливаются; в памяти — один кусок и несколько строк для вывода.
+# -----------------------------
+TAIL_ROWS = pd.get_option('display.min_rows')
+HEAD_ROWS = pd.get_option('display.max_rows') + 1
+# когда весь файл в памяти, квартили берутся прямо по столбцу; при слиянии
+# кусков — по частотам значений, пока различных значений в столбце
+# не больше DISTINCT_MAX (иначе в describe будет NaN)
+DISTINCT_MAX = 100_000
+
+def merge_dtype(a, b):
+    # как read_csv выбрал бы тип столбца для всего файла сразу
+    if a == b:
+        return a
+    if a.kind in 'iuf' and b.kind in 'iuf':
+        return np.promote_types(a, b)
+    if a.kind in 'iuf':
+        return b
+    if b.kind in 'iuf':
+        return a
+    return np.dtype(object)
+
+def _numeric_stats(x):
+    # [count, mean, M2, min, max] и частоты значений непустого столбца x (float64)
+    uniq, counts = np.unique(x, return_counts=True)
+    values = (uniq, counts) if len(uniq) <= DISTINCT_MAX else None
+    if not len(x):
+        return [0, 0.0, 0.0, np.nan, np.nan], values
+    mean = x.mean()
+    d = x - mean
+    return [len(x), float(mean), float(d @ d), float(uniq[0]), float(uniq[-1])], values
+
+def merge_counts(a, b):
+    uniq, inverse = np.unique(np.concatenate([a[0], b[0]]), return_inverse=True)
+    counts = np.bincount(inverse, weights=np.concatenate([a[1], b[1]])).astype(np.int64)
+    return (uniq, counts) if len(uniq) <= DISTINCT_MAX else None
+
+def quantile_from_counts(values, q):
+    # как np.percentile(..., method='linear') по развёрнутым значениям
+    vals, counts = values
+    n = int(counts.sum())
+    if n == 0:
+        return float('nan')
+    h = (n - 1) * q
+    lo = int(np.floor(h))
+    cum = counts.cumsum()
+    v_lo = vals[np.searchsorted(cum, lo, side='right')]
+    v_hi = vals[np.searchsorted(cum, min(lo + 1, n - 1), side='right')]
+    return float(np.quantile(np.array([v_lo, v_hi]), h - lo))
+
+class PartialStats:
+    """Сливаемые агрегаты по части файла: счётчики, суммы, пропуски,
+    суммы по группам (Sex, Pclass) и первые/последние строки для вывода."""
+
+    def __init__(self):
+        self.rows = 0
+        self.columns = []
+        self.dtypes = {}
+        self.nulls = {}
+        # столбец -> [count, mean, M2, min, max] (M2 — сумма квадратов отклонений)
+        self.numeric = {}
+        self.values = {}  # столбец -> (значения, частоты) или None, если значений слишком много
+        self.quartiles = {}  # столбец -> точные [25%, 50%, 75%], пока агрегаты не сливались
+        self.survived_known = 0
+        self.survived_alive = 0
+        # None — все, 1 — выжившие, 0 — умершие: [сумма Age, число Age]
+        self.age = {None: [0.0, 0], 1: [0.0, 0], 0: [0.0, 0]}
+        self.groups = {}
+        self.head = None
+        self.tail = None
+
+    @classmethod
+    def from_chunk(cls, chunk, exact=False):
+        """Все метрики отчёта за один проход по столбцам: маска пропусков
+        каждого столбца считается один раз и нужна всем агрегатам.
+
+        exact=True — chunk это весь файл: квартили считаются по столбцу
+        точно, без ограничения DISTINCT_MAX.
+        """
+        p = cls()
+        p.rows = len(chunk)
+        p.columns = list(chunk.columns)
+        p.dtypes = dict(chunk.dtypes)
+        masks = {}
+        for col in p.columns:
+            s = chunk[col]
+            if s.dtype.kind in 'iuf':
+                v = s.to_numpy(dtype=float)
+                ok = ~np.isnan(v)
+                x = v if ok.all() else v[ok]
+                p.numeric[col], p.values[col] = _numeric_stats(x)
+                if exact:
+                    p.quartiles[col] = (np.quantile(x, [0.25, 0.5, 0.75]).tolist()
+                                        if len(x) else [float('nan')] * 3)
+            else:
+                ok = s.notna().to_numpy()
+            masks[col] = ok
+            p.nulls[col] = len(ok) - int(np.count_nonzero(ok))
+        if {"Survived", "Age"}.issubset(masks):
+            p.survived_known, p.survived_alive, p.age = survival_sums(chunk, masks)
+        if SUMMARY_COLUMNS.issubset(masks):
+            p.groups = group_sums(chunk, masks)
+        p.head = chunk.iloc[:HEAD_ROWS]
+        p.tail = chunk.iloc[-TAIL_ROWS:]
+        return p
+
+    def merge(self, other):
+        """Добавляет агрегаты other — части файла, идущей после этой."""
+        if self.head is None:
+            # копия, а не ссылки: следующие слияния меняют списки и словари на месте
+            self.__dict__.update(copy.deepcopy({k: v for k, v in other.__dict__.items()
+                                                if k not in ('head', 'tail')}))
+            self.head, self.tail = other.head, other.tail
+            return self
+        self.rows += other.rows
+        self.quartiles = {}  # точны только для одного куска
+        for col in other.columns:
+            if col in self.dtypes:
+                self.dtypes[col] = merge_dtype(self.dtypes[col], other.dtypes[col])
+                self.nulls[col] += other.nulls[col]
+            else:
+                self.columns.append(col)
+                self.dtypes[col], self.nulls[col] = other.dtypes[col], other.nulls[col]
+        for col, counts in other.values.items():
+            if col not in self.values:
+                self.values[col] = counts
+            elif self.values[col] is None or counts is None:
+                self.values[col] = None
+            else:
+                self.values[col] = merge_counts(self.values[col], counts)
+        for col, (n2, mean2, m2b, lo2, hi2) in other.numeric.items():
+            if col not in self.numeric or self.numeric[col][0] == 0:
+                self.numeric[col] = [n2, mean2, m2b, lo2, hi2]
+                continue
+            if n2 == 0:
+                continue
+            n1, mean1, m2a, lo1, hi1 = self.numeric[col]
+            n = n1 + n2
+            delta = mean2 - mean1
+            self.numeric[col] = [n, mean1 + delta * n2 / n, m2a + m2b + delta * delta * n1 * n2 / n,
+                                 min(lo1, lo2), max(hi1, hi2)]
+        self.survived_known += other.survived_known
+        self.survived_alive += other.survived_alive
+        for key, (total, count) in other.age.items():
+            self.age[key][0] += total
+            self.age[key][1] += count
+        for key, sums in other.groups.items():
+            mine = self.groups.setdefault(key, [0, 0.0, 0.0, 0.0])
+            for i in range(4):
+                mine[i] += sums[i]
+        if len(self.head) < HEAD_ROWS:
+            self.head = pd.concat([self.head, other.head.iloc[:HEAD_ROWS - len(self.head)]])
+        self.tail = pd.concat([self.tail, other.tail]).iloc[-TAIL_ROWS:]
+        return self
+
+    def _cast(self, frame):
+        # строки из разных кусков приводим к типам, общим для всего файла
+        return frame.astype({col: self.dtypes[col] for col in self.columns})
+
+    def frame_text(self):
+        """То же, что repr(df) для всего файла."""
+        if self.rows < HEAD_ROWS:
+            return repr(self._cast(self.head))
+        frame = self._cast(pd.concat([self.head.iloc[:TAIL_ROWS], self.tail]))
+        with pd.option_context('display.max_rows', len(frame) - 1):
+            text = repr(frame)
+        return text.rsplit('\n\n[', 1)[0] + f"\n\n[{self.rows} rows x {len(self.columns)} columns]"
+
+    def head_frame(self, source, n):
+        # source — весь DataFrame, путь к CSV, если файл читался кусками,
+        # или список путей, если агрегаты слиты из нескольких файлов
+        if n <= len(self.head):
+            return self._cast(self.head.head(n))
+        if isinstance(source, pd.DataFrame):
+            return source.head(n)
+        if isinstance(source, str):
+            source = [source]
+        parts = []
+        for path in source:
+            parts.append(pd.read_csv(path, nrows=n, usecols=self.columns))
+            n -= len(parts[-1])
+            if n <= 0:
+                break
+        return self._cast(pd.concat(parts))
+
+    def missing(self):
+        return int(sum(self.nulls.values()))
+
+    def dtypes_series(self):
+        return pd.Series([self.dtypes[col] for col in self.columns], index=self.columns)
+
+    def describe(self):
+        cols = [c for c in self.columns if self.dtypes[c].kind in 'iuf' and c in self.numeric]
+        data = {}
+        for col in cols:
+            n, mean, m2, lo, hi = self.numeric[col]
+            std = (m2 / (n - 1)) ** 0.5 if n > 1 else float('nan')
+            counts = self.values[col]
+            quartiles = self.quartiles.get(col)
+            if quartiles is None:
+                quartiles = [quantile_from_counts(counts, q) if counts is not None else float('nan')
+                             for q in (0.25, 0.5, 0.75)]
+            data[col] = [float(n), mean if n else float('nan'), std, lo, *quartiles, hi]
+        return pd.DataFrame(data, index=['count', 'mean', 'std', 'min', '25%', '50%', '75%', 'max'], dtype=float)
+
+    def print_survival_stats(self):
+        if not {"Survived", "Age"}.issubset(self.columns):
+            print("Не хватает столбцов для анализа.")
+            return
+        survived_pct = self.survived_alive / self.survived_known * 100 if self.survived_known else 0
+        print_survival_stats(survived_pct, _mean(*self.age[None]), _mean(*self.age[1]), _mean(*self.age[0]))
+
+    def summary_table(self):
+        if not SUMMARY_COLUMNS.issubset(self.columns):
+            return None
+        return summary_from_groups(self.groups, self.dtypes['Sex'], self.dtypes['Pclass'])
+
+def stream_stats(path, chunksize, columns=None):
+    stats = PartialStats()
+    for chunk in pd.read_csv(path, chunksize=chunksize, usecols=_usecols(columns)):
+        stats.merge(PartialStats.from_chunk(chunk))
+    return stats
+
+def compute_stats(df):
+    return PartialStats.from_chunk(df, exact=True)
+
+# -----------------------------
+# Отчёт
+# -----------------------------
+def print_report(stats, source, reports=tuple(REPORTS), rows=None):
+    if 'overview' in reports:
+        print_overview(stats, source, rows)
+    if 'survival' in reports:
+        stats.print_survival_stats()
+    if 'summary' in reports:
+        print(stats.summary_table())
+
+def print_overview(stats, source, rows=None):
+    # rows — сколько строк показать; None — спросить
+    print(stats.frame_text())
+    print('---------------------------------')
+
+    print(f"Всего пропусков: {stats.missing()}")
+
+    print(stats.dtypes_series())
 
+    n = rows if rows is not None else int(input("Введите количество строк: "))
+    print(stats.head_frame(source, n))
 
-df = load_data(CSV_PATH)
-print(df)
-print('---------------------------------')
+    print(stats.describe())
+    print((stats.rows, len(stats.columns)))
 
-missing = analyze_missing(df)
-print(f"Всего пропусков: {missing}")
+    print('---------------------------------')
 
-print_column_info(df)
+def file_stats(path, reports=tuple(REPORTS), chunksize=None, cache=True, optimize=False):
+    """Агрегаты отчёта по одному файлу — единица работы для пула процессов."""
+    columns = required_columns(reports)
+    if chunksize:
+        return stream_stats(path, chunksize, columns)
+    if optimize:
+        df, _, _ = load_optimized(path, reports, cache=cache)
+    else:
+        df = load_data(path, columns, cache=cache)
+    return compute_stats(df)
 
-n = int(input("Введите количество строк: "))
-show_head(df, n)
+def report(path, cache=True, reports=tuple(REPORTS), optimize=False, rows=None):
+    if optimize:
+        df, before, after = load_optimized(path, reports, cache=cache)
+        print_memory_report(df, before, after)
+    else:
+        df = load_data(path, required_columns(reports), cache=cache)
+    print_report(compute_stats(df), df, reports, rows)
 
-describe_numeric(df)
-print_shape(df)
+def report_streaming(path, chunksize, reports=tuple(REPORTS), rows=None):
+    print_report(stream_stats(path, chunksize, required_columns(reports)), path, reports, rows)
 
-print('---------------------------------')
+def report_files(paths, jobs=None, reports=tuple(REPORTS), rows=5, chunksize=None, cache=True,
+                 optimize=False, per_file=False):
+    """Отчёт по многим файлам: агрегаты каждого считаются в пуле процессов
+    и сливаются в порядке paths — как если бы файлы шли один за другим."""
+    work = functools.partial(file_stats, reports=reports, chunksize=chunksize, cache=cache, optimize=optimize)
+    total = PartialStats()
+    with ProcessPoolExecutor(max_workers=jobs) as pool:
+        for path, stats in zip(paths, pool.map(work, paths)):
+            if per_file:
+                print(f"=== {path}")
+                print_report(stats, path, reports, rows)
+            total.merge(stats)
+    print(f"=== Всего файлов: {len(paths)}")
+    print_report(total, paths, reports, rows)
+    return total
 
-compute_survival_stats(df)
+def expand_paths(patterns):
+    paths = []
+    for pattern in patterns:
+        # только файлы: шаблон вроде 'data.*' иначе зацепит и каталог кэша data.csv.cache
+        found = sorted(p for p in glob.glob(pattern) if os.path.isfile(p)) if glob.has_magic(pattern) else [pattern]
+        paths.extend(p for p in found if p not in paths)
+    return paths
 
-summary = create_summary_table(df)
-print(summary)
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser(description="Отчёт по пассажирам Титаника")
+    ap.add_argument('paths', nargs='*',
+                    help="CSV или шаблоны ('data/*.csv'); несколько файлов считаются в пуле процессов "
+                         f"(по умолчанию {CSV_PATH})")
+    ap.add_argument('--chunksize', type=int, help='читать файл кусками по N строк (для файлов больше памяти)')
+    ap.add_argument('--no-cache', action='store_true', help='не читать и не создавать кэш <файл>.cache')
+    ap.add_argument('--reports', default=','.join(REPORTS),
+                    help='какие части отчёта печатать: ' + ', '.join(REPORTS) + ' (читаются только их столбцы)')
+    ap.add_argument('--optimize', action='store_true',
+                    help='компактные типы столбцов (SCHEMA) и отчёт о сэкономленной памяти')
+    ap.add_argument('--rows', type=int, help='строк для показа начала таблицы (без вопроса)')
+    ap.add_argument('--jobs', type=int, help='процессов для нескольких файлов (по умолчанию — по числу ядер)')
+    ap.add_argument('--per-file', action='store_true', help='печатать отчёт и по каждому файлу')
+    args = ap.parse_args()
+    reports = args.reports.split(',')
+    unknown = set(reports) - set(REPORTS)
+    if unknown:
+        ap.error('неизвестные отчёты: ' + ', '.join(sorted(unknown)))
+    rows = args.rows
+    if args.paths:
+        # файлы заданы в командной строке — запуск не интерактивный, без вопроса
+        paths = expand_paths(args.paths)
+        if not paths:
+            ap.error('нет файлов по шаблону: ' + ' '.join(args.paths))
+        if rows is None:
+            rows = 5
+    else:
+        paths = [CSV_PATH]
+    if len(paths) > 1:
+        report_files(paths, jobs=args.jobs, reports=reports, rows=rows,
+                     chunksize=args.chunksize, cache=not args.no_cache, optimize=args.optimize,
+                     per_file=args.per_file)
+    elif args.chunksize:
+        report_streaming(paths[0], args.chunksize, reports, rows)
+    else:
+        report(paths[0], cache=not args.no_cache, reports=reports, optimize=args.optimize, rows=rows)